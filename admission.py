@@ -0,0 +1,229 @@
+"""admission control in front of 'Roll the dice!'
+
+Every roll costs an Ollama generation, so rolls are admitted only if:
+
+* the same roll is not already in flight (duplicate submissions are dropped)
+* fewer than max_concurrent rolls are generating across all players
+* the player still has a token in their bucket (rate per minute, with a burst)
+
+Two state backends share the same rules:
+
+* InProcessAdmissionState - plain dicts behind striped locks, one process
+* SQLiteAdmissionState - a small SQLite file shared by workers on one host
+"""
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+
+from storage import forget_connections_after_fork
+
+ADMITTED = 'admitted'
+DUPLICATE = 'duplicate'
+BUSY = 'busy'  # global concurrency cap reached
+RATE_LIMITED = 'rate_limited'
+
+
+@dataclass(frozen=True)
+class Admission:
+    """outcome of an admission check"""
+    status: str
+    retry_after: float = 0.0
+    ticket: tuple = None  # (user_id, roll_key) to release once the roll finishes
+
+    @property
+    def admitted(self):
+        return self.status == ADMITTED
+
+
+def _refill(tokens, updated, now, rate, burst):
+    """token count after refilling a bucket since its last update"""
+    return min(burst, tokens + (now - updated) * rate)
+
+
+def _wait_for_token(tokens, rate):
+    """seconds until the bucket holds one full token"""
+    return (1.0 - tokens) / rate if rate > 0 else 60.0
+
+
+class InProcessAdmissionState:
+    """admission state held in this process"""
+
+    STRIPES = 16
+
+    def __init__(self):
+        # buckets are spread over striped locks, so players rarely wait on each other
+        self._bucket_locks = [threading.Lock() for _ in range(self.STRIPES)]
+        self._buckets = [{} for _ in range(self.STRIPES)]  # user_id -> (tokens, updated)
+        self._flight_lock = threading.Lock()
+        self._in_flight = set()
+
+    def _stripe(self, user_id):
+        return zlib.crc32(str(user_id).encode()) % self.STRIPES
+
+    def try_admit(self, user_id, roll_key, rate, burst, max_concurrent, lease_seconds):
+        ticket = (user_id, roll_key)
+        with self._flight_lock:
+            if ticket in self._in_flight:
+                return Admission(DUPLICATE, retry_after=1.0)
+            if len(self._in_flight) >= max_concurrent:
+                return Admission(BUSY, retry_after=1.0)
+            # slot reserved while the bucket is checked, under its own lock
+            self._in_flight.add(ticket)
+
+        # bucket checked last, so duplicates and busy rejections cost no tokens
+        stripe = self._stripe(user_id)
+        now = time.monotonic()
+        with self._bucket_locks[stripe]:
+            tokens, updated = self._buckets[stripe].get(user_id, (burst, now))
+            tokens = _refill(tokens, updated, now, rate, burst)
+            limited = tokens < 1.0
+            self._buckets[stripe][user_id] = (tokens if limited else tokens - 1.0, now)
+
+        if limited:
+            self.release(ticket)
+            return Admission(RATE_LIMITED, retry_after=_wait_for_token(tokens, rate))
+        return Admission(ADMITTED, ticket=ticket)
+
+    def release(self, ticket):
+        with self._flight_lock:
+            self._in_flight.discard(ticket)
+
+    def in_flight(self):
+        with self._flight_lock:
+            return len(self._in_flight)
+
+
+class SQLiteAdmissionState:
+    """admission state in a SQLite file, shared by all workers on one host
+
+    Rolls in flight are leases with an expiry, so a worker that dies mid-roll
+    cannot hold a slot forever.
+    """
+
+    def __init__(self, database_path):
+        self.database_path = database_path
+        self._local = threading.local()
+        forget_connections_after_fork(self)
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS roll_buckets (
+            user_id TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated REAL NOT NULL
+        )
+        ''')
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS roll_leases (
+            user_id TEXT NOT NULL,
+            roll_key TEXT NOT NULL,
+            expires REAL NOT NULL,
+            PRIMARY KEY (user_id, roll_key)
+        )
+        ''')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # autocommit mode, transactions are opened explicitly below
+            conn = sqlite3.connect(self.database_path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def try_admit(self, user_id, roll_key, rate, burst, max_concurrent, lease_seconds):
+        user_key = str(user_id)
+        now = time.time()  # wall clock, shared between processes
+        conn = self._connection()
+        # write lock up front, the whole check is a handful of indexed statements
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM roll_leases WHERE expires < ?", (now,))
+            if conn.execute(
+                "SELECT 1 FROM roll_leases WHERE user_id = ? AND roll_key = ?", (user_key, roll_key)
+            ).fetchone():
+                conn.execute("COMMIT")
+                return Admission(DUPLICATE, retry_after=1.0)
+            if conn.execute("SELECT COUNT(*) FROM roll_leases").fetchone()[0] >= max_concurrent:
+                conn.execute("COMMIT")
+                return Admission(BUSY, retry_after=1.0)
+
+            row = conn.execute("SELECT tokens, updated FROM roll_buckets WHERE user_id = ?", (user_key,)).fetchone()
+            tokens = _refill(row[0], row[1], now, rate, burst) if row else burst
+            admitted = tokens >= 1.0
+            if admitted:
+                tokens -= 1.0
+                conn.execute(
+                    "INSERT INTO roll_leases (user_id, roll_key, expires) VALUES (?, ?, ?)",
+                    (user_key, roll_key, now + lease_seconds)
+                )
+            conn.execute(
+                "INSERT OR REPLACE INTO roll_buckets (user_id, tokens, updated) VALUES (?, ?, ?)",
+                (user_key, tokens, now)
+            )
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+
+        if not admitted:
+            return Admission(RATE_LIMITED, retry_after=_wait_for_token(tokens, rate))
+        return Admission(ADMITTED, ticket=(user_key, roll_key))
+
+    def release(self, ticket):
+        self._connection().execute("DELETE FROM roll_leases WHERE user_id = ? AND roll_key = ?", ticket)
+
+    def in_flight(self):
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM roll_leases WHERE expires >= ?", (time.time(),)
+        ).fetchone()[0]
+
+    def close(self):
+        """closing the connection of the current thread"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class RollAdmission:
+    """per-user token bucket, global concurrency cap and in-flight dedup"""
+
+    def __init__(self, rolls_per_minute=6, burst=3, max_concurrent=4, lease_seconds=300, state=None):
+        self.rate = rolls_per_minute / 60.0  # tokens per second
+        self.burst = burst
+        self.max_concurrent = max_concurrent
+        self.lease_seconds = lease_seconds
+        self.state = state or InProcessAdmissionState()
+
+    def try_admit(self, user_id, roll_key):
+        """admitting a roll, the ticket of an admitted roll must be released"""
+        return self.state.try_admit(
+            user_id, roll_key, self.rate, self.burst, self.max_concurrent, self.lease_seconds
+        )
+
+    def release(self, admission):
+        if admission.ticket is not None:
+            self.state.release(admission.ticket)
+
+    def in_flight(self):
+        return self.state.in_flight()
+
+    def close(self):
+        if hasattr(self.state, 'close'):
+            self.state.close()
+
+
+def create_roll_admission(config):
+    """roll admission from the app config, shared via SQLite if DICE_ADMISSION_DB is set"""
+    state = None
+    if config.get('DICE_ADMISSION_DB'):
+        state = SQLiteAdmissionState(config['DICE_ADMISSION_DB'])
+    return RollAdmission(
+        rolls_per_minute=config['DICE_ROLLS_PER_MINUTE'],
+        burst=config['DICE_BURST'],
+        max_concurrent=config['DICE_MAX_CONCURRENT'],
+        state=state
+    )
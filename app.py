@@ -1,350 +1,105 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, get_flashed_messages
-import sqlite3
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, get_flashed_messages, current_app, abort
 import os
 import json
+import math
+import hashlib
+import time
+import concurrent.futures
 from datetime import datetime
 import uuid
 import traceback
 import bcrypt
+import click
 import requests
 
-# DB directory and path
-DATABASE_PATH = 'db/mystical_tale.db'
-
-# Database connection function
-def get_db_connection():
-    """connection to the SQLite database"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-# Database initialization
-def init_db():
-    """init database tables and populate initial story"""
-    try:
-        print("Initializing database...")
-        db_dir = os.path.dirname(DATABASE_PATH)
-        os.makedirs(db_dir, exist_ok=True)
-        print(f"Database directory {db_dir} ensured.")
-
-        conn = get_db_connection()
-        c = conn.cursor()
-        print("Database connection established.")
-
-        # Users table creation
-        print("Attempting to create 'users' table...")
-        c.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT NOT NULL UNIQUE,
-            password TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        ''')
-        print("'users' table creation statement executed.")
-
-        # Characters table creation
-        print("Attempting to create 'characters' table...")
-        c.execute('''
-        CREATE TABLE IF NOT EXISTS characters (
-            id TEXT PRIMARY KEY,
-            user_id INTEGER NOT NULL, -- Foreign key linking to the users table
-            name TEXT NOT NULL,
-            race TEXT NOT NULL,
-            archetype TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        )
-        ''')
-        print("'characters' table creation statement executed.")
-
-        # save_games table creation
-        c.execute('''
-        CREATE TABLE IF NOT EXISTS save_games (
-            id TEXT PRIMARY KEY,
-            character_id TEXT NOT NULL,
-            current_node_id TEXT NOT NULL,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            save_name TEXT NOT NULL,
-            FOREIGN KEY (character_id) REFERENCES characters(id)
-        )
-        ''')
-        print("'save_games' table creation statement executed.")
-
-        # story_nodes table creation
-        c.execute('''
-        CREATE TABLE IF NOT EXISTS story_nodes (
-            id TEXT PRIMARY KEY,
-            text TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        ''')
-        print("'story_nodes' table creation statement executed.")
-
-        # Choices table linked to story nodes
-        c.execute('''
-        CREATE TABLE IF NOT EXISTS choices (
-            id TEXT PRIMARY KEY,
-            node_id TEXT NOT NULL,
-            text TEXT NOT NULL,
-            next_node_id TEXT NOT NULL,
-            FOREIGN KEY (node_id) REFERENCES story_nodes(id)
-        )
-        ''')
-        print("'choices' table creation statement executed.")
-
-        # initial story nodes population - if not done already
-        c.execute("SELECT COUNT(*) FROM story_nodes")
-        if c.fetchone()[0] == 0:
-            print("Populating initial story nodes...")
-            populate_story_nodes(c)
-            print("Story nodes population finished.")
-        else:
-            print("Story nodes already populated.")
-
-        conn.commit()
-        print("Database connection committed.")
-        conn.close()
-        print("Database connection closed.")
-        print("Database initialization finished successfully.")
-    except sqlite3.Error as e:
-        print(f"Database initialization error: {e}")
-        print(traceback.format_exc())
-        if conn:
-            conn.rollback()
-            conn.close()
-        print("Database initialization failed due to SQLite error.")
-        raise
-    except Exception as e:
-        print(f"An unexpected error occurred during database initialization: {e}")
-        print(traceback.format_exc())
-        if conn:
-            conn.rollback()
-            conn.close()
-        print("Database initialization failed due to unexpected error.")
-        raise
-
-
-# Story content initialization
-def populate_story_nodes(cursor):
-    """populating the story_nodes and choices tables with initial content"""
-    try:
-        cursor.execute(
-            "INSERT INTO story_nodes (id, text) VALUES (?, ?)",
-            ('start', 'You awaken in a clearing bathed in moonlight, your mind hazy with forgotten memories. The last thing you recall is following a strange light deep into the Whispering Woods.\n\nAll around you, ancient trees loom like silent guardians, their branches swaying gently as if communicating in a language long forgotten by mortal kind.\n\nA soft, melodic voice calls to you from the shadows: "Awakened one, you have crossed the threshold between worlds. The veil is thin tonight, and your destiny awaits."')
-        )
-
-        # adding choices for start node
-        choices = [
-            ('c1', 'start', 'Call out to the mysterious voice', 'voice_response'),
-            ('c2', 'start', 'Examine your surroundings more carefully', 'examine_clearing'),
-            ('c3', 'start', 'Try to remember how you got here', 'remember_path')
-        ]
-        cursor.executemany(
-            "INSERT INTO choices (id, node_id, text, next_node_id) VALUES (?, ?, ?, ?)",
-            choices
-        )
-
-        # voice response node
-        cursor.execute(
-            "INSERT INTO story_nodes (id, text) VALUES (?, ?)",
-            ('voice_response', '"Who\'s there?" you call into the darkness, your voice echoing strangely among the trees.\n\nA figure emerges from the shadows—a woman with skin like polished alabaster and eyes that shift colors like opals in the moonlight. Her hair floats around her as if suspended in water, and her flowing garments seem woven from starlight itself.\n\n"I am Elysia, Guardian of the Threshold," she says, her voice resonating in your mind rather than your ears. "Few mortals find their way here, and fewer still are chosen by the Whispering Woods."')
-        )
-
-        # adding choices for voice_response node
-        choices = [
-            ('c4', 'voice_response', '"Chosen? What do you mean I was chosen?"', 'chosen_explanation'),
-            ('c5', 'voice_response', '"Where exactly am I? What is this place?"', 'place_explanation'),
-            ('c6', 'voice_response', '"I need to return home immediately."', 'return_home')
-        ]
-        cursor.executemany(
-            "INSERT INTO choices (id, node_id, text, next_node_id) VALUES (?, ?, ?, ?)",
-            choices
-        )
-
-        # clearing node
-        cursor.execute(
-            "INSERT INTO story_nodes (id, text) VALUES (?, ?)",
-            ('examine_clearing', 'You take a moment to study your surroundings more carefully. The clearing is perfectly circular, as if carved with purpose rather than formed by nature. Small luminescent mushrooms form a ring around its edge, pulsing with a gentle blue light.\n\nAt the center, where you awoke, the grass forms an intricate spiral pattern that seems to glow faintly under the moonlight. You notice strange symbols etched into the surrounding trees—ancient runes that seem to shimmer when you focus directly on them.\n\nA small stone altar stands at the far edge of the clearing, covered in moss and bearing a small silver bowl filled with clear liquid that reflects the stars above with impossible clarity.')
-        )
-
-        # adding choices for clearing node
-        choices = [
-            ('c7', 'examine_clearing', 'Approach the stone altar', 'approach_altar'),
-            ('c8', 'examine_clearing', 'Examine the glowing mushroom ring', 'examine_mushrooms'),
-            ('c9', 'examine_clearing', 'Study the strange runes on the trees', 'study_runes')
-        ]
-        cursor.executemany(
-            "INSERT INTO choices (id, node_id, text, next_node_id) VALUES (?, ?, ?, ?)",
-            choices
-        )
-
-        # the path node for the record
-        cursor.execute(
-            "INSERT INTO story_nodes (id, text) VALUES (?, ?)",
-            ('remember_path', 'You close your eyes, focusing on the fragments of memory that drift through your mind like autumn leaves on a stream.\n\nYou recall walking home along your usual path when a strange light—like a lantern but with a flame of shifting colors—appeared among the trees. Something about it called to you, compelling you to follow as it danced just beyond your reach.\n\nDeeper and deeper it led you into the woods, until the path disappeared and the trees grew ancient and strange.The air became thick with the scent of moss and night-blooming flowers, and faint music seemed to play from nowhere and everywhere.\n\nThen came a threshold—a sensation of passing through a veil of cool mist—and then... darkness, until you awoke here in this clearing.')
-        )
-
-        # adding choices for path node
-        choices = [
-            ('c10', 'remember_path', 'Try to find the path you came from', 'find_path'),
-            ('c11', 'remember_path', 'Call out for help', 'call_help'),
-            # choice leads to 'seek_light'
-            ('c12', 'remember_path', 'Look for the colored light you followed', 'seek_light')
-        ]
-        cursor.executemany(
-            "INSERT INTO choices (id, node_id, text, next_node_id) VALUES (?, ?, ?, ?)",
-            choices
-        )
+from models import Choice
+from storage import StorageError, create_storage
+from story_graph import build_story_graph
+from admission import BUSY, DUPLICATE, RATE_LIMITED, create_roll_admission
+from cache import create_record_cache
+from seed import register_seed_command
+from backup import register_backup_commands
+from sharding import register_shard_commands
+from profiler import PROFILE_HEADER, create_request_profiler, register_request_profiler
+from maintenance import MaintenanceScheduler, RequestActivity, create_maintenance_scheduler
+from fallback_pool import DYNAMIC_CONTEXT, DYNAMIC_NODE_ID, RollStats, pick_fallback_segment, refill_fallback_pool, refill_targets
 
-        # chosen explanation node
-        cursor.execute(
-            "INSERT INTO story_nodes (id, text) VALUES (?, ?)",
-            ('chosen_explanation', 'Elysia\'s smile is both warm and mysterious. "The Woods have a consciousness all their own—ancient and inscrutable. They do not call to mortals without purpose."\n\nShe gestures to the trees around you, which seem to lean in slightly as if listening.\n\n"There is an imbalance growing between your world and ours. The boundaries weaken, and creatures that should remain in shadow have begun to cross. The Woods sensed something in you—a potential, a key perhaps—that might help restore what has been broken."\n\nShe extends her hand, a small pendant dangling from her fingers. It appears to be a silver leaf veined with luminescent blue.\n\n"This imbalance threatens both our realms. Will you help us discover what causes it and set things right?"')
-        )
+# DB directory and path
+DATABASE_PATH = os.environ.get('DATABASE_PATH', 'db/mystical_tale.db')
+# storage backend - 'sqlite' (tuned, file-backed), 'sharded' (players spread over
+# SHARD_COUNT files next to DATABASE_PATH) or 'memory' (no disk I/O)
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'sqlite')
+SHARD_COUNT = int(os.environ.get('SHARD_COUNT', 4))
 
-        # adding choices for chosen_explanation node
-        choices = [
-            ('c13', 'chosen_explanation', 'Accept the pendant and offer your help', 'accept_quest'),
-            ('c14', 'chosen_explanation', 'Ask for more information before deciding', 'more_information'),
-            ('c15', 'chosen_explanation', 'Refuse and insist on returning home', 'refuse_quest')
-        ]
-        cursor.executemany(
-            "INSERT INTO choices (id, node_id, text, next_node_id) VALUES (?, ?, ?, ?)",
-            choices
-        )
+def get_storage():
+    """storage backend of the current app"""
+    return current_app.extensions['storage']
 
-        # placeholder nodes for remaining paths
-        placeholder_nodes = [
-            ('place_explanation', 'You ask Elysia about this mysterious place, and she explains that you are in the Whispering Woods, a realm that exists between the mortal world and the fae realms.'),
-            ('return_home', 'When you express your need to return home, Elysia\'s expression becomes serious. "The way back is not as simple as you might hope..."'),
-            ('approach_altar', 'You approach the stone altar cautiously, drawn by the mysterious liquid in the silver bowl.'),
-            ('examine_mushrooms', 'You kneel down to examine the luminescent mushrooms that form a perfect circle around the clearing.'),
-            ('study_runes', 'As you approach one of the trees to study the strange runes etched into its bark, the symbols seem to shift and dance before your eyes.'),
-            ('find_path', 'You search the edges of the clearing for any sign of the path you followed to get here.'),
-            ('call_help', 'You call out for help, your voice echoing strangely among the ancient trees.'),
-            ('accept_quest', 'You accept the pendant from Elysia and promise to help restore balance between the realms.'),
-            ('more_information', 'You ask Elysia for more information before deciding.'),
-            ('refuse_quest', 'You refuse the pendant and insist on finding your way home as soon as possible.')
-        ]
-
-        for node_id, text in placeholder_nodes:
-            if node_id != 'seek_light':
-                 cursor.execute("INSERT INTO story_nodes (id, text) VALUES (?, ?)", (node_id, text))
-                 cursor.execute(
-                     "INSERT INTO choices (id, node_id, text, next_node_id) VALUES (?, ?, ?, ?)",
-                     (str(uuid.uuid4()), node_id, 'Continue your journey', 'start')
-                 )
-
-        # checking if 'seek_light' node exists
-        cursor.execute(
-            "INSERT OR IGNORE INTO story_nodes (id, text) VALUES (?, ?)",
-            ('seek_light', 'You look around for any sign of the colored light that led you here. The clearing is still bathed in moonlight, but the strange light is nowhere to be seen. The path you followed seems to have vanished, leaving you truly lost in the Whispering Woods.')
-        )
-        # we offer players 'Roll the dice!'
+def get_story_graph():
+    """precomputed story graph analysis of the current app"""
+    return current_app.extensions['story_graph']
 
-    except sqlite3.Error as e:
-        print(f"Error populating story nodes: {e}")
-        raise
+def get_record_cache():
+    """cross-request cache for characters and save lists of the current app"""
+    return current_app.extensions['record_cache']
 
+def get_roll_admission():
+    """admission control for dice rolls of the current app"""
+    return current_app.extensions['roll_admission']
 
 # Database helper functions
 def get_character(character_id):
-    """character fetching by their ID"""
-    conn = None
-    try:
-        conn = get_db_connection()
-        c = conn.cursor()
-        c.execute("SELECT * FROM characters WHERE id = ?", (character_id,))
-        character = c.fetchone()
-        if character:
-            return dict(character)
-        return None
-    except sqlite3.Error as e:
-        print(f"Database error in get_character: {e}")
-        print(traceback.format_exc())
-        return None
-    finally:
-        if conn:
-            conn.close()
+    """character fetching by their ID (cached, characters never change)"""
+    return get_record_cache().lookup('characters', character_id, get_storage().get_character)
 
 def get_story_node(node_id):
-    """story node and its associated choices fetching by node ID"""
-    conn = None
-    try:
-        conn = get_db_connection()
-        c = conn.cursor()
-
-        # getting the node text
-        c.execute("SELECT * FROM story_nodes WHERE id = ?", (node_id,))
-        node = c.fetchone()
-
-        if not node:
-            return None
+    """story node and its associated choices fetching by node ID (loaded at startup, read-only)"""
+    return current_app.extensions['story_nodes'].get(node_id) or get_storage().get_story_node(node_id)
 
-        # getting the choices for the node
-        c.execute("SELECT * FROM choices WHERE node_id = ?", (node_id,))
-        choices = c.fetchall()
-
-        result = dict(node)
-        result['choices'] = [dict(choice) for choice in choices]
-
-        return result
-    except sqlite3.Error as e:
-        print(f"Database error in get_story_node: {e}")
-        print(traceback.format_exc())
-        return None
-    finally:
-        if conn:
-            conn.close()
+def get_dynamic_choices():
+    """choices of the LLM generated segment, rebuilt from the texts kept in the session"""
+    return [
+        # choices bring player to the next LLM generated node
+        Choice(f"dynamic-{i}", 'dynamic', text['text'] if isinstance(text, dict) else text, 'dynamic')
+        for i, text in enumerate(session.get('dynamic_choices', []))  # dicts in sessions from before
+    ]
 
 def get_save_games_for_character(character_id):
-    """save games fetching for a specific character"""
-    conn = None
-    try:
-        conn = get_db_connection()
-        c = conn.cursor()
-        c.execute("SELECT * FROM save_games WHERE character_id = ? ORDER BY timestamp DESC", (character_id,))
-        save_games = [dict(row) for row in c.fetchall()]
-        return save_games
-    except sqlite3.Error as e:
-        print(f"Database error in get_save_games_for_character: {e}")
-        print(traceback.format_exc())
-        return []
-    finally:
-        if conn:
-            conn.close()
+    """save games fetching for a specific character (cached until the next save or delete, in any worker)"""
+    storage = get_storage()
+    return get_record_cache().lookup(
+        'save_lists', character_id, storage.get_saves_for_character, version=storage.get_save_list_version
+    )
 
 def get_all_save_games_for_user(user_id):
     """save games fetching for a specific user, including story snippet"""
-    conn = None
-    try:
-        conn = get_db_connection()
-        c = conn.cursor()
-        # query to join with characters & story_nodes
-        c.execute("""
-            SELECT sg.*, c.name AS character_name, c.race, c.archetype, sn.text AS story_text_snippet
-            FROM save_games sg
-            JOIN characters c ON sg.character_id = c.id
-            JOIN story_nodes sn ON sg.current_node_id = sn.id -- Join with story_nodes
-            WHERE c.user_id = ? -- Filter by the logged-in user's ID
-            ORDER BY sg.timestamp DESC
-        """, (user_id,))
-        save_games = [dict(row) for row in c.fetchall()]
-        return save_games
-    except sqlite3.Error as e:
-        print(f"Database error in get_all_save_games_for_user: {e}")
-        print(traceback.format_exc())
-        return []
-    finally:
-        if conn:
-            conn.close()
+    return get_storage().get_saves_for_user(user_id)
+
+# saves per page of search results
+SEARCH_PAGE_SIZE = 20
+
+def search_save_games_for_user(user_id, query, page=1):
+    """one page of the user's saves matching a search, and whether more pages follow"""
+    offset = (page - 1) * SEARCH_PAGE_SIZE
+    # one extra row tells if there is a next page, without counting every match
+    results = get_storage().search_saves(user_id, query, limit=SEARCH_PAGE_SIZE + 1, offset=offset)
+    return results[:SEARCH_PAGE_SIZE], len(results) > SEARCH_PAGE_SIZE
+
+def get_page_number():
+    """page number from the query string, 1 if missing or invalid"""
+    return max(1, request.args.get('page', 1, type=int) or 1)
 
 # LLM API configuration
 OLLAMA_API_URL = os.environ.get('OLLAMA_API_URL', 'http://localhost:11434/api/generate')
 OLLAMA_MODEL_NAME = os.environ.get('OLLAMA_MODEL_NAME', 'gemma3')
 
-def generate_story_content(prompt_text):
+# upper bound for one Ollama call, a stuck call would otherwise hold its roll slot forever
+OLLAMA_TIMEOUT = float(os.environ.get('OLLAMA_TIMEOUT', 120))
+
+class StoryGenerationError(Exception):
+    """raised when Ollama fails or returns nothing usable"""
+
+def generate_story_content(prompt_text, timeout=OLLAMA_TIMEOUT):
     """API call to generate dynamic journey story content"""
     try:
         payload = {
@@ -359,7 +114,7 @@ def generate_story_content(prompt_text):
         print(f"Calling Ollama API at: {OLLAMA_API_URL}")
         print(f"Prompt: {prompt_text[:200]}...") # 200 chars (head) of prompt
 
-        response = requests.post(OLLAMA_API_URL, json=payload, headers=headers)
+        response = requests.post(OLLAMA_API_URL, json=payload, headers=headers, timeout=timeout)
         response.raise_for_status() # exception - bad status codes (4xx or 5xx)
 
         result = response.json()
@@ -372,22 +127,283 @@ def generate_story_content(prompt_text):
     except requests.exceptions.RequestException as e:
         print(f"Error calling Ollama API: {e}")
         print(traceback.format_exc())
-        return f"Error generating content: Could not connect to Ollama or API error. Details: {e}"
+        raise StoryGenerationError(f"Could not connect to Ollama or API error. Details: {e}") from e
     except Exception as e:
         print(f"An unexpected error occurred during Ollama call: {e}")
         print(traceback.format_exc())
-        return f"Error generating content: An unexpected error occurred. Details: {e}"
+        raise StoryGenerationError(f"An unexpected error occurred. Details: {e}") from e
+
+def parse_generated_content(generated_content):
+    """story text and choice texts of an Ollama response, StoryGenerationError if either is missing"""
+    story_text = ""
+    choice_lines = []
+    in_choices_section = False
+
+    lines = generated_content.split('\n')
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+
+        # parsing as if "Choice X:" format
+        if line.startswith("Choice 1:"):
+            in_choices_section = True
+            choice_lines.append(line[len("Choice 1:"):].strip())
+        elif line.startswith("Choice 2:"):
+            in_choices_section = True
+            choice_lines.append(line[len("Choice 2:"):].strip())
+        elif line.startswith("Choice 3:"):
+            in_choices_section = True
+            choice_lines.append(line[len("Choice 3:"):].strip())
+        elif in_choices_section:
+             if choice_lines:
+                  choice_lines[-1] += (" " + line).strip()
+        else:
+            # accumulating story text before the choices section
+            story_text += line + "\n"
+
+    # cleaning up story text (which removes trailing newlines)
+    story_text = story_text.strip()
+
+    if not story_text or not choice_lines:
+        raise StoryGenerationError("Response has no story text or no choices in the expected format.")
+    return story_text, choice_lines
+
+def build_story_prompt(character_info, current_story_text):
+    """game prompt for the LLM, continuing the story from the current text"""
+    return f"""
+            The player's character is a {character_info}.
+            They are currently at this point in the story:
+            "{current_story_text}"
+
+            Generate the next part of the story (around 100-200 words) and then provide exactly three distinct choices for the player to make.
+            Format your response clearly with the story text first, followed by the choices.
+            Use the following format for choices:
+            Choice 1: [Text of the first choice]
+            Choice 2: [Text of the second choice]
+            Choice 3: [Text of the third choice]
+
+            Ensure the choices are logical continuations of the story and offer different paths. The story should continue directly from the current situation.
+            """
+
+def get_roll_stats():
+    """dice roll generation and fallback counters of the current app"""
+    return current_app.extensions['roll_stats']
+
+def get_roll_executor():
+    """thread pool running Ollama calls for dice rolls of the current app"""
+    return current_app.extensions['roll_executor']
+
+def wait_for_story_segment(future, node_id, character):
+    """generated story text and choices, or a fallback pool segment when generation
+    misses the roll deadline or fails
+    """
+    stats = get_roll_stats()
+    started = time.monotonic()
+    try:
+        generated_content = future.result(timeout=current_app.config['ROLL_DEADLINE_SECONDS'])
+        story_text, choice_lines = parse_generated_content(generated_content)
+        stats.record_generated(time.monotonic() - started)
+        return story_text, choice_lines
+    except concurrent.futures.TimeoutError:
+        print(f"Roll deadline missed at node {node_id}, serving a fallback segment")
+        deadline_missed = True
+        # Ollama keeps going in the background, its late result is dropped
+        future.add_done_callback(stats.record_late_completion)
+    except StoryGenerationError as e:
+        print(f"Story generation failed at node {node_id}, serving a fallback segment: {e}")
+        deadline_missed = False
+
+    race = character.race if character else None
+    archetype = character.archetype if character else None
+    segment, level = pick_fallback_segment(get_storage(), node_id, race, archetype)
+    stats.record_fallback(level, deadline_missed)
+    return segment['story_text'], segment['choices']
+
+
+# maintenance tasks that can be run from the command line
+MAINTENANCE_TASKS = MaintenanceScheduler.TASKS
+
+# messages for rolls turned away by admission control
+ROLL_REJECTED_MESSAGES = {
+    DUPLICATE: 'Your dice are already rolling. Please wait for the story to unfold.',
+    BUSY: 'Many adventurers are rolling the dice right now. Please try again in a moment.',
+    RATE_LIMITED: 'The dice need a moment to rest. Please try again shortly.',
+}
+
+def roll_rejected_response(admission):
+    """flash message for the browser, HTTP 429 with Retry-After for API clients"""
+    retry_after = max(1, math.ceil(admission.retry_after))
+    message = ROLL_REJECTED_MESSAGES[admission.status]
+    if request.accept_mimetypes.best == 'application/json':
+        response = jsonify(error=message, reason=admission.status, retry_after=retry_after)
+        return response, 429, {'Retry-After': str(retry_after)}
+    flash(message)
+    return redirect(url_for('game'))
 
 
 # Main application factory function
-def create_app():
-    """function to create and configure the Flask"""
+def create_app(storage_backend=None, database_path=None, config=None):
+    """function to create and configure the Flask
+
+    storage_backend picks the storage - 'sqlite' (default), 'sharded' or 'memory'
+    config overrides any of the settings below
+    """
     app = Flask(__name__)
     app.secret_key = os.environ.get('SECRET_KEY', os.urandom(24))
+    app.config.update(
+        STORAGE_BACKEND=STORAGE_BACKEND,
+        DATABASE_PATH=DATABASE_PATH,
+        SHARD_COUNT=SHARD_COUNT,
+        # dice roll admission control - per-user token bucket and global cap
+        DICE_ROLLS_PER_MINUTE=float(os.environ.get('DICE_ROLLS_PER_MINUTE', 6)),
+        DICE_BURST=int(os.environ.get('DICE_BURST', 3)),
+        DICE_MAX_CONCURRENT=int(os.environ.get('DICE_MAX_CONCURRENT', 4)),
+        # SQLite file shared by all workers on this host, in-process state if empty
+        DICE_ADMISSION_DB=os.environ.get('DICE_ADMISSION_DB'),
+        # seconds a roll waits for Ollama before a fallback pool segment is served
+        ROLL_DEADLINE_SECONDS=float(os.environ.get('ROLL_DEADLINE_SECONDS', 15)),
+        # cross-request caches for characters and per-character save lists
+        CHARACTER_CACHE_SIZE=int(os.environ.get('CHARACTER_CACHE_SIZE', 1024)),
+        SAVE_LIST_CACHE_SIZE=int(os.environ.get('SAVE_LIST_CACHE_SIZE', 1024)),
+        SAVE_LIST_CACHE_TTL=float(os.environ.get('SAVE_LIST_CACHE_TTL', 30)),
+        # background database maintenance (SQLite storage only), intervals in seconds
+        MAINTENANCE_ENABLED=os.environ.get('MAINTENANCE_ENABLED', '1') == '1',
+        MAINTENANCE_WINDOW=os.environ.get('MAINTENANCE_WINDOW', ''),  # e.g. '02:00-05:00', empty = any time
+        MAINTENANCE_TICK=float(os.environ.get('MAINTENANCE_TICK', 5)),
+        MAINTENANCE_IDLE_SECONDS=float(os.environ.get('MAINTENANCE_IDLE_SECONDS', 1)),
+        MAINTENANCE_STEP_BUDGET=float(os.environ.get('MAINTENANCE_STEP_BUDGET', 0.05)),
+        MAINTENANCE_RUN_BUDGET=float(os.environ.get('MAINTENANCE_RUN_BUDGET', 2)),
+        MAINTENANCE_CHECKPOINT_INTERVAL=float(os.environ.get('MAINTENANCE_CHECKPOINT_INTERVAL', 300)),
+        MAINTENANCE_OPTIMIZE_INTERVAL=float(os.environ.get('MAINTENANCE_OPTIMIZE_INTERVAL', 3600)),
+        MAINTENANCE_VACUUM_INTERVAL=float(os.environ.get('MAINTENANCE_VACUUM_INTERVAL', 3600)),
+        MAINTENANCE_ORPHANS_INTERVAL=float(os.environ.get('MAINTENANCE_ORPHANS_INTERVAL', 3600)),
+        # opt-in request profiling - requests with a signed X-Profile header or a random sample
+        PROFILE_ENABLED=os.environ.get('PROFILE_ENABLED', '0') == '1',
+        PROFILE_SAMPLE_RATE=float(os.environ.get('PROFILE_SAMPLE_RATE', 0)),
+        PROFILE_ROUTES=os.environ.get('PROFILE_ROUTES', ''),  # e.g. 'game,roll_the_dice', empty = all routes
+        PROFILE_DIR=os.environ.get('PROFILE_DIR', 'profiles'),
+        PROFILE_KEEP=int(os.environ.get('PROFILE_KEEP', 100)),
+        PROFILE_INTERVAL=float(os.environ.get('PROFILE_INTERVAL', 0.005)),
+        PROFILE_TOKEN_MAX_AGE=int(os.environ.get('PROFILE_TOKEN_MAX_AGE', 3600)),
+        # /stats/* endpoints, off by default and only for logged-in users when on
+        STATS_ENABLED=os.environ.get('STATS_ENABLED', '0') == '1',
+    )
+    app.config.update(config or {})
+    if storage_backend:
+        app.config['STORAGE_BACKEND'] = storage_backend
+    if database_path:
+        app.config['DATABASE_PATH'] = database_path
+
+    # every route reads and writes through this storage
+    storage = create_storage(app.config['STORAGE_BACKEND'], app.config['DATABASE_PATH'], app.config['SHARD_COUNT'])
+    app.extensions['storage'] = storage
 
     # DB init when the app context is ready
     with app.app_context():
-        init_db()
+        storage.init_db()
+
+    # the story is read-only while the app runs, so it is loaded once -
+    # with a preloading server, forked workers share this copy
+    app.extensions['story_nodes'] = storage.get_story_nodes()
+
+    # story graph analysis, once the story is loaded
+    story_graph = build_story_graph(storage)
+    app.extensions['story_graph'] = story_graph
+    for line in story_graph.report_lines():
+        print(line)
+
+    roll_admission = create_roll_admission(app.config)
+    app.extensions['roll_admission'] = roll_admission
+    app.extensions['record_cache'] = create_record_cache(app.config)
+    # admission control caps rolls in flight, so the pool never queues a roll
+    app.extensions['roll_executor'] = concurrent.futures.ThreadPoolExecutor(
+        max_workers=app.config['DICE_MAX_CONCURRENT'], thread_name_prefix='roll-generation'
+    )
+    app.extensions['roll_stats'] = RollStats()
+
+    register_seed_command(app, storage)
+    register_backup_commands(app, storage)
+    register_shard_commands(app, storage)
+
+    # --- background database maintenance ---
+    maintenance = None
+    if hasattr(storage, 'database_paths'):
+        activity = RequestActivity()
+        maintenance = create_maintenance_scheduler(storage, app.config, activity)
+        app.extensions['maintenance'] = maintenance
+
+        if app.config['MAINTENANCE_ENABLED']:
+            @app.before_request
+            def track_request_start():
+                # started lazily, so each forked worker process gets its own thread
+                maintenance.start()
+                activity.started()
+
+            @app.teardown_request
+            def track_request_end(error=None):
+                activity.finished()
+
+    # --- request profiling ---
+    profiler = create_request_profiler(app.config, app.secret_key)
+    app.extensions['request_profiler'] = profiler
+    if profiler is not None:
+        # no hooks at all while profiling is off
+        register_request_profiler(app, profiler)
+
+    @app.cli.command('profile-token')
+    def profile_token():
+        """print a header value that gets a request profiled"""
+        if profiler is None:
+            raise click.ClickException("Profiling is off, set PROFILE_ENABLED=1.")
+        if not os.environ.get('SECRET_KEY'):
+            # without it every process signs with its own random key
+            raise click.ClickException("SECRET_KEY is not set, the server could not verify the token. "
+                                       "Set the same SECRET_KEY as the web server.")
+        print(f"{PROFILE_HEADER}: {profiler.create_token()}")
+
+    @app.cli.command('maintenance')
+    @click.option('--task', 'tasks', multiple=True,
+                  type=click.Choice(MAINTENANCE_TASKS + MaintenanceScheduler.ONE_OFF_TASKS),
+                  help='Task to run, all scheduled tasks if not given.')
+    def run_maintenance(tasks):
+        """run database maintenance now, ignoring the low-traffic window"""
+        if maintenance is None:
+            raise click.ClickException("Maintenance needs the 'sqlite' storage backend.")
+        maintenance.run_tasks(tasks or MAINTENANCE_TASKS)
+
+    @app.cli.command('refill-fallback-pool')
+    @click.option('--per-target', default=3, show_default=True,
+                  help='Segments wanted per story node, race and archetype.')
+    @click.option('--limit', type=int, help='Stop after adding this many segments.')
+    @click.option('--poll', default=2.0, show_default=True, help='Seconds between idle checks.')
+    def refill_pool(per_target, limit, poll):
+        """pre-generate fallback story segments while no dice roll is in flight"""
+        if not app.config['DICE_ADMISSION_DB']:
+            # in-process admission state cannot see the rolls of the web server
+            print("DICE_ADMISSION_DB is not set, generating without waiting for the web server to be idle.")
+
+        def generate(node_id, race, archetype):
+            if node_id == DYNAMIC_NODE_ID:
+                context = DYNAMIC_CONTEXT
+            else:
+                context = storage.get_story_node(node_id).text
+            # no character name, pool segments are shared by every character of a race and archetype
+            prompt_text = build_story_prompt(f"{race} {archetype}", context)
+            return parse_generated_content(generate_story_content(prompt_text))
+
+        summary = refill_fallback_pool(
+            storage, refill_targets(story_graph), per_target, generate,
+            is_idle=lambda: roll_admission.in_flight() == 0, poll=poll, limit=limit
+        )
+        print(f"Fallback pool: {summary['added']} segments added, {summary['failed']} failed, "
+              f"{summary['missing'] - summary['added']} still missing.")
+
+    @app.cli.command('story-report')
+    def story_report():
+        """print the story graph validation report"""
+        for line in story_graph.report_lines():
+            print(line)
 
     # --- defining each route ---
 
@@ -428,7 +444,7 @@ def create_app():
             if current_node_id == 'dynamic':
                 # LLM content retrieval directly from the session
                 story_text_to_display = session.get('dynamic_story_text', 'Error loading dynamic story.')
-                choices_to_display = session.get('dynamic_choices', [])
+                choices_to_display = get_dynamic_choices()
                 current_node_info = None # No pre-defined node object when LLM generated
 
                 # for the next LLM call to have context, managing state in /roll-the-dice.
@@ -442,8 +458,8 @@ def create_app():
                     session.pop('current_node_id', None)
                     return redirect(url_for('game'))
 
-                story_text_to_display = current_node_info['text']
-                choices_to_display = current_node_info['choices']
+                story_text_to_display = current_node_info.text
+                choices_to_display = current_node_info.choices
                 session.pop('dynamic_story_text', None)
                 session.pop('dynamic_choices', None)
 
@@ -460,6 +476,11 @@ def create_app():
             # fetching save games for the character
             save_games = get_save_games_for_character(character_id)
 
+            # where the pre-defined story runs out, we offer players 'Roll the dice!'
+            story_graph = get_story_graph()
+            offer_dice_roll = story_graph.offers_dice_roll(current_node_id)
+            progress = story_graph.progress(current_node_id)
+
             return render_template(
                 'game.html',
                 character=character,
@@ -468,7 +489,9 @@ def create_app():
                 choices_to_display=choices_to_display, # list of choices
                 save_games=save_games,
                 flashed_messages=messages,
-                current_node_id=current_node_id
+                current_node_id=current_node_id,
+                offer_dice_roll=offer_dice_roll,
+                progress=progress # (depth, max depth), None if LLM generated
             )
 
         except Exception as e:
@@ -500,12 +523,16 @@ def create_app():
                       print(f"Debug: Player chose dynamic choice: {chosen_dynamic_choice}")
 
             else:
+                # dice can only be rolled where the pre-defined story runs out
+                if not get_story_graph().offers_dice_roll(current_node_id):
+                     flash('The dice cannot be rolled here. Choose one of the paths.')
+                     return redirect(url_for('game'))
                 current_node = get_story_node(current_node_id)
                 if not current_node:
                      flash('Error getting current story context.')
                      # redirecting back if current node not found
                      return redirect(url_for('game'))
-                current_story_text = current_node['text']
+                current_story_text = current_node.text
                 # if player rolls the dice from pre-defined game, clearing previous LLM provided content
                 session.pop('dynamic_story_text', None)
                 session.pop('dynamic_choices', None)
@@ -513,76 +540,38 @@ def create_app():
 
             # getting character information for context
             character = get_character(character_id)
-            character_info = f"Character: {character['name']}, {character['race']} {character['archetype']}" if character else "Your character"
+            character_info = f"Character: {character.name}, {character.race} {character.archetype}" if character else "Your character"
 
 
             # --- Game prompt for the LLM ---
-            prompt_text = f"""
-            The player's character is a {character_info}.
-            They are currently at this point in the story:
-            "{current_story_text}"
-
-            Generate the next part of the story (around 100-200 words) and then provide exactly three distinct choices for the player to make.
-            Format your response clearly with the story text first, followed by the choices.
-            Use the following format for choices:
-            Choice 1: [Text of the first choice]
-            Choice 2: [Text of the second choice]
-            Choice 3: [Text of the third choice]
-
-            Ensure the choices are logical continuations of the story and offer different paths. The story should continue directly from the current situation.
-            """
-
-            # Ollama API call to generate content
-            generated_content = generate_story_content(prompt_text)
-
-            # --- parsing generated content ---
-            story_text = ""
-            choices = []
-            choice_lines = []
-            in_choices_section = False
-
-            lines = generated_content.split('\n')
-            for line in lines:
-                line = line.strip()
-                if not line:
-                    continue
-
-                # parsing as if "Choice X:" format
-                if line.startswith("Choice 1:"):
-                    in_choices_section = True
-                    choice_lines.append(line[len("Choice 1:"):].strip())
-                elif line.startswith("Choice 2:"):
-                    in_choices_section = True
-                    choice_lines.append(line[len("Choice 2:"):].strip())
-                elif line.startswith("Choice 3:"):
-                    in_choices_section = True
-                    choice_lines.append(line[len("Choice 3:"):].strip())
-                elif in_choices_section:
-                     if choice_lines:
-                          choice_lines[-1] += (" " + line).strip()
-                else:
-                    # accumulating story text before the choices section
-                    story_text += line + "\n"
-
-            # cleaning up story text (which removes trailing newlines)
-            story_text = story_text.strip()
-
-            # converting parsed choice into the template format
-            dynamic_choices = []
-            for i, choice_text in enumerate(choice_lines):
-                 # generating a unique ID for each dynamic choice
-                 choice_id = f"dynamic-{uuid.uuid4()}"
-                 dynamic_choices.append({
-                     'id': choice_id,
-                     'node_id': 'dynamic',
-                     'text': choice_text,
-                     'next_node_id': 'dynamic' # choices bring player to the next LLM generated node
-                 })
+            prompt_text = build_story_prompt(character_info, current_story_text)
+
+            # admission control - duplicate rolls, global cap and per-user rate
+            chosen_dynamic_choice = request.form.get('chosen_dynamic_choice', '')
+            roll_key = hashlib.sha1(
+                f"{character_id}|{current_node_id}|{chosen_dynamic_choice}".encode('utf-8')
+            ).hexdigest()
+            roll_admission = get_roll_admission()
+            admission = roll_admission.try_admit(user_id, roll_key)
+            if not admission.admitted:
+                print(f"Debug: Roll rejected for user {user_id}: {admission.status}")
+                return roll_rejected_response(admission)
+
+            # Ollama API call on the roll executor, the player waits at most the roll deadline
+            try:
+                future = get_roll_executor().submit(generate_story_content, prompt_text)
+            except RuntimeError:
+                roll_admission.release(admission)
+                raise
+            # the slot is given back once Ollama is done, not at the deadline,
+            # so abandoned generations still count against the global cap
+            future.add_done_callback(lambda _: roll_admission.release(admission))
+            story_text, choice_lines = wait_for_story_segment(future, current_node_id, character)
 
             # --- storing LLM generated content ---
-            # story parts will not be saved to our DB
+            # story parts will not be saved to our DB, only the choice texts go to the session
             session['dynamic_story_text'] = story_text
-            session['dynamic_choices'] = dynamic_choices
+            session['dynamic_choices'] = choice_lines
             session['current_node_id'] = 'dynamic'
 
             flash('The dice have been rolled! Your journey takes a new turn.')
@@ -639,28 +628,19 @@ def create_app():
 
                 character_id = str(uuid.uuid4())
 
-                conn = get_db_connection()
-                c = conn.cursor()
                 try:
-                    # user_id in the INSERT
-                    c.execute(
-                        "INSERT INTO characters (id, user_id, name, race, archetype) VALUES (?, ?, ?, ?, ?)",
-                        (character_id, user_id, name, race, archetype)
-                    )
-                    conn.commit()
+                    # character linked to the logged-in user
+                    get_storage().create_character(character_id, user_id, name, race, archetype)
+                    get_record_cache().invalidate('characters', character_id)
                     session['character_id'] = character_id
                     session['current_node_id'] = 'start'
 
                     flash(f'Welcome, {name}! Your mystical adventure awaits!')
                     return redirect(url_for('game'))
-                except sqlite3.Error as e:
-                    conn.rollback()
-                    print(f"SQLite error in character creation: {e}")
-                    print(traceback.format_exc())
+                except StorageError as e:
+                    print(f"Storage error in character creation: {e}")
                     flash('Database error occurred during character creation. Please try again.')
                     return redirect(url_for('character_creation'))
-                finally:
-                    conn.close()
             except Exception as e:
                 print(f"Unexpected error during character creation: {e}")
                 print(traceback.format_exc())
@@ -681,14 +661,10 @@ def create_app():
                 flash('Invalid choice')
                 return redirect(url_for('game'))
 
-            conn = get_db_connection()
-            c = conn.cursor()
-            c.execute("SELECT next_node_id FROM choices WHERE id = ?", (choice_id,))
-            choice = c.fetchone()
-            conn.close()
+            next_node_id = get_storage().get_next_node_id(choice_id)
 
-            if choice:
-                session['current_node_id'] = choice['next_node_id']
+            if next_node_id:
+                session['current_node_id'] = next_node_id
                 # ** flashing a new message to indicate choice was made **
                 flash('Your choice has been made.')
                 # LLM content deletion from session to move to pre-defined game
@@ -729,25 +705,16 @@ def create_app():
                 flash('Error retrieving character information')
                 return redirect(url_for('game'))
 
-            conn = get_db_connection()
-            c = conn.cursor()
             try:
-                # ** save_name in the INSERT **
-                c.execute(
-                    "INSERT INTO save_games (id, character_id, current_node_id, save_name) VALUES (?, ?, ?, ?)",
-                    (str(uuid.uuid4()), character_id, current_node_id, save_name)
-                )
-                conn.commit()
+                # ** save_name stored with the save **
+                get_storage().create_save(str(uuid.uuid4()), character_id, current_node_id, save_name)
+                get_record_cache().invalidate('save_lists', character_id)
                 flash(f'Your journey has been preserved as "{save_name}" in the mystical archives')
                 return redirect(url_for('game'))
-            except sqlite3.Error as e:
-                conn.rollback()
-                print(f"SQLite error in save_game: {e}")
-                print(traceback.format_exc())
+            except StorageError as e:
+                print(f"Storage error in save_game: {e}")
                 flash('Database error occurred while saving your game. Please try again.')
                 return redirect(url_for('game'))
-            finally:
-                conn.close()
         except Exception as e:
             print(f"Error in save_game: {e}")
             print(traceback.format_exc())
@@ -757,15 +724,11 @@ def create_app():
     @app.route('/load-game/<save_id>')
     def load_game(save_id):
         try:
-            conn = get_db_connection()
-            c = conn.cursor()
-            c.execute("SELECT * FROM save_games WHERE id = ?", (save_id,))
-            save_game = c.fetchone()
-            conn.close()
+            save_game = get_storage().get_save(save_id)
 
             if save_game:
-                session['character_id'] = save_game['character_id']
-                session['current_node_id'] = save_game['current_node_id']
+                session['character_id'] = save_game.character_id
+                session['current_node_id'] = save_game.current_node_id
                 # deleting LLM generated content from session
                 session.pop('dynamic_story_text', None)
                 session.pop('dynamic_choices', None)
@@ -789,10 +752,22 @@ def create_app():
                 flash('Please log in to view your saved games.')
                 return redirect(url_for('login'))
 
-            # ** getting games for the logged-in user **
-            save_games = get_all_save_games_for_user(user_id)
+            # ** searching or getting all games for the logged-in user **
+            query = request.args.get('q', '').strip()
+            page = get_page_number()
+            has_next = False
+            if query:
+                save_games, has_next = search_save_games_for_user(user_id, query, page)
+            else:
+                save_games = get_all_save_games_for_user(user_id)
 
-            return render_template('load_game.html', save_games=save_games)
+            return render_template(
+                'load_game.html',
+                save_games=save_games,
+                query=query,
+                page=page,
+                has_next=has_next
+            )
 
         except Exception as e:
             print(f"Error in load_saves: {e}")
@@ -800,6 +775,30 @@ def create_app():
             flash('An error occurred while retrieving saved games. Please try again.')
             return redirect(url_for('index'))
 
+    @app.route('/search-saves')
+    def search_saves():
+        """ranked, paginated save search as JSON"""
+        user_id = session.get('user_id')
+        if not user_id:
+            return jsonify(error='Please log in to search your saved games.'), 401
+
+        query = request.args.get('q', '').strip()
+        page = get_page_number()
+        save_games, has_next = search_save_games_for_user(user_id, query, page)
+        return jsonify(
+            query=query,
+            page=page,
+            has_next=has_next,
+            results=[{
+                'id': save.id,
+                'save_name': save.save_name,
+                'timestamp': save.timestamp,
+                'character_name': save.character_name,
+                'current_node_id': save.current_node_id,
+                'url': url_for('load_game', save_id=save.id)
+            } for save in save_games]
+        )
+
     @app.route('/signup', methods=['GET', 'POST'])
     def signup():
         if request.method == 'POST':
@@ -811,39 +810,27 @@ def create_app():
                     flash('Please provide both username and password.')
                     return redirect(url_for('signup'))
 
-                conn = get_db_connection()
-                c = conn.cursor()
+                storage = get_storage()
 
                 # checking if username already exists
-                c.execute("SELECT id FROM users WHERE username = ?", (username,))
-                existing_user = c.fetchone()
+                existing_user = storage.get_user_by_username(username)
 
                 if existing_user:
                     flash('Username already exists. Please pick a different name.')
-                    conn.close()
                     return redirect(url_for('signup'))
 
                 # hashing password for user
                 hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
 
                 # inserting new user into DB
-                c.execute(
-                    "INSERT INTO users (username, password) VALUES (?, ?)",
-                    (username, hashed_password)
-                )
-                conn.commit()
-                conn.close()
+                storage.create_user(username, hashed_password)
 
                 flash('Account created successfully! Please log in.')
                  # redirecting to login once signup is complete
                 return redirect(url_for('login'))
 
-            except sqlite3.Error as e:
-                if conn:
-                    conn.rollback()
-                    conn.close()
-                print(f"SQLite error during signup: {e}")
-                print(traceback.format_exc())
+            except StorageError as e:
+                print(f"Storage error during signup: {e}")
                 flash('Database error occurred during signup. Please try again.')
                 return redirect(url_for('signup'))
             except Exception as e:
@@ -864,20 +851,15 @@ def create_app():
                 flash('Please provide both username and password.')
                 return redirect(url_for('login'))
 
-            conn = get_db_connection()
-            c = conn.cursor()
-
             # request to get user from the database
-            c.execute("SELECT * FROM users WHERE username = ?", (username,))
-            user = c.fetchone()
-            conn.close()
+            user = get_storage().get_user_by_username(username)
 
             if user:
                 # password verification
-                if bcrypt.checkpw(password.encode('utf-8'), user['password']):
+                if bcrypt.checkpw(password.encode('utf-8'), user.password):
                     # if password is correct, letting user in
-                    session['user_id'] = user['id']
-                    flash(f'Welcome back, {user["username"]}!')
+                    session['user_id'] = user.id
+                    flash(f'Welcome back, {user.username}!')
                     # redirecting to game page
                     return redirect(url_for('game'))
                 else:
@@ -906,29 +888,17 @@ def create_app():
                 flash('Please log in to delete saved games.')
                 return redirect(url_for('login'))
 
-            conn = get_db_connection()
-            c = conn.cursor()
-
-            # if saved game belongs to logged-in user
-            c.execute("""
-                SELECT sg.id
-                FROM save_games sg
-                JOIN characters c ON sg.character_id = c.id
-                WHERE sg.id = ? AND c.user_id = ?
-            """, (save_id, user_id))
-            save_to_delete = c.fetchone()
-
-            if save_to_delete:
-                # in case, saved game exists and belongs to the user, letting to delete it
-                c.execute("DELETE FROM save_games WHERE id = ?", (save_id,))
-                conn.commit()
+            storage = get_storage()
+            save_to_delete = storage.get_save(save_id)
+
+            # deleted only if saved game belongs to logged-in user
+            if save_to_delete and storage.delete_save_for_user(save_id, user_id):
+                get_record_cache().invalidate('save_lists', save_to_delete.character_id)
                 flash('Saved game deleted successfully.')
             else:
                 # in case of saved game doesn't exist or doesn't belong to the user
                 flash('Could not delete the specified saved game.')
 
-            conn.close()
-
             return redirect(url_for('load_saves'))
         except Exception as e:
             print(f"Error in delete_save route: {e}")
@@ -937,6 +907,45 @@ def create_app():
             return redirect(url_for('load_saves'))
 
 
+    @app.route('/healthz')
+    def healthz():
+        """health check for load balancers and process managers"""
+        if not get_storage().check_health():
+            return jsonify(status='unavailable', pid=os.getpid()), 503
+        return jsonify(status='ok', pid=os.getpid())
+
+    @app.before_request
+    def guard_stats():
+        """/stats/* exposes database paths and server internals, so it is opt-in and needs a login"""
+        if not request.path.startswith('/stats/'):
+            return None
+        if not current_app.config['STATS_ENABLED']:
+            abort(404)
+        if not session.get('user_id'):
+            return jsonify(error='Please log in to view server statistics.'), 401
+        return None
+
+    @app.route('/stats/cache')
+    def cache_stats():
+        """hit ratio and memory use of the record caches"""
+        return jsonify(get_record_cache().stats())
+
+    @app.route('/stats/rolls')
+    def roll_stats():
+        """generated vs fallback rolls, deadline misses and generation latency"""
+        stats = get_roll_stats().stats()
+        stats['deadline_seconds'] = current_app.config['ROLL_DEADLINE_SECONDS']
+        stats['in_flight'] = get_roll_admission().in_flight()
+        stats['fallback_pool_segments'] = sum(get_storage().count_fallback_segments().values())
+        return jsonify(stats)
+
+    @app.route('/stats/maintenance')
+    def maintenance_stats():
+        """reports of the latest maintenance runs, newest first"""
+        maintenance = current_app.extensions.get('maintenance')
+        reports = list(reversed(maintenance.load_reports())) if maintenance else []
+        return jsonify(reports=reports)
+
     @app.route('/clear-session')
     def clear_session():
         session.clear()
@@ -0,0 +1,353 @@
+"""online backups and NDJSON export / import of player data
+
+* backup - SQLite's backup API, copying a few pages per step while the app
+  keeps running. The source is pinned to one read snapshot for the whole
+  copy: in WAL mode that never blocks writers, and the copy cannot restart
+  (an unpinned step-wise backup starts over whenever another connection
+  writes, so under steady traffic it may never finish).
+* export - users, characters and saves streamed as one JSON object per line,
+  from a single read snapshot. Memory stays flat whatever the database size.
+* import - the reverse, in batches inside one transaction, so a failed
+  import leaves the database as it was. New saves are indexed for search
+  in one pass at the end.
+
+Files ending in .gz are compressed. Story content is not exported, it comes
+with the code.
+
+With a sharded storage every database file is backed up on its own (shards
+first, then the catalog, so every backed up character has its user), and
+export / import read users from the catalog and players from their shards.
+"""
+import gzip
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+from models import Character, SaveGame, User, columns, row_factory
+from storage import shard_path
+
+EXPORT_FORMAT = 'mystical-tale-export'
+EXPORT_VERSION = 1
+
+# export line type -> table and record, in import order (parents first)
+EXPORT_TABLES = (
+    ('user', 'users', User),
+    ('character', 'characters', Character),
+    ('save', 'save_games', SaveGame),
+)
+
+
+def _open(path, mode):
+    """text file, gzip-compressed when the name ends in .gz"""
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def _pin_snapshot(conn):
+    """opening a read transaction, later reads see the database as it is now"""
+    conn.execute("BEGIN")
+    conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+
+
+# --- online backup ---
+
+def backup_database(source_path, target_path, pages=1024, pause=0.0, verify=True):
+    """copying a live database to target_path, returns a report dict
+
+    pages is the number of pages per step, pause the seconds to wait between
+    steps (to leave disk bandwidth to requests). The copy is written next to
+    the target and renamed into place once complete.
+    """
+    partial_path = target_path + '.partial'
+    target_dir = os.path.dirname(target_path)
+    if target_dir:
+        os.makedirs(target_dir, exist_ok=True)
+    if os.path.exists(partial_path):
+        os.remove(partial_path)
+
+    source = sqlite3.connect(source_path, isolation_level=None)
+    target = sqlite3.connect(partial_path)
+    steps = []  # seconds each step took
+    started = last = time.monotonic()
+
+    def progress(status, remaining, total):
+        nonlocal last
+        now = time.monotonic()
+        steps.append(now - last)
+        if pause:
+            time.sleep(pause)
+        last = time.monotonic()
+
+    try:
+        journal_mode = source.execute("PRAGMA journal_mode").fetchone()[0]
+        # outside WAL mode the read lock would hold back writers for the whole copy
+        pinned = journal_mode == 'wal'
+        if pinned:
+            _pin_snapshot(source)
+        source.backup(target, pages=pages, progress=progress)
+        page_count = target.execute("PRAGMA page_count").fetchone()[0]
+        page_size = target.execute("PRAGMA page_size").fetchone()[0]
+        check = target.execute("PRAGMA quick_check").fetchone()[0] if verify else None
+    finally:
+        if source.in_transaction:
+            source.rollback()
+        source.close()
+        target.close()
+
+    if verify and check != 'ok':
+        raise sqlite3.DatabaseError(f"Backup failed its integrity check: {check}")
+    os.replace(partial_path, target_path)
+
+    seconds = time.monotonic() - started
+    size_mb = page_count * page_size / (1024 * 1024)
+    return {
+        'target': target_path,
+        'pages': page_count,
+        'size_mb': round(size_mb, 2),
+        'seconds': round(seconds, 3),
+        'mb_per_second': round(size_mb / seconds, 1) if seconds else None,
+        'steps': len(steps),
+        # how long each step held the source's read lock
+        'longest_step_ms': round(max(steps, default=0) * 1000, 2),
+        'snapshot_pinned': pinned,
+        'verified': verify,
+    }
+
+
+def backup_targets(storage, target_path):
+    """(source, target) paths to back up a storage to target_path, shards before the catalog
+
+    Shards are backed up next to the catalog's target like they sit next to
+    the catalog - backup.db, backup.shard-0.db, ...
+    """
+    pairs = [
+        (shard.database_path, shard_path(target_path, index))
+        for index, shard in enumerate(storage.shards) if shard is not storage.catalog
+    ]
+    return pairs + [(storage.catalog.database_path, target_path)]
+
+
+# --- NDJSON export / import ---
+
+def _export_line(kind, record):
+    row = record._asdict()
+    if kind == 'user' and isinstance(row['password'], bytes):
+        # bcrypt hashes are ASCII
+        row['password'] = row['password'].decode('ascii')
+    return json.dumps({'type': kind, **row}, separators=(',', ':')) + '\n'
+
+
+def _databases_for(storage, kind):
+    """databases holding the rows of an export line type"""
+    return (storage.catalog,) if kind == 'user' else storage.shards
+
+
+def export_data(storage, path, batch_size=1000):
+    """streaming users, characters and saves to an NDJSON file, returns the counts"""
+    counts = {kind: 0 for kind, _, _ in EXPORT_TABLES}
+    # shards are pinned before the catalog, so the users of every exported character are exported
+    conns = {database: database.connect() for database in dict.fromkeys((*storage.shards, storage.catalog))}
+    try:
+        for conn in conns.values():
+            conn.isolation_level = None
+            _pin_snapshot(conn)
+        with _open(path, 'w') as out:
+            out.write(json.dumps({
+                'type': 'header',
+                'format': EXPORT_FORMAT,
+                'version': EXPORT_VERSION,
+                'exported_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            }) + '\n')
+            for kind, table, record in EXPORT_TABLES:
+                for database in _databases_for(storage, kind):
+                    cursor = conns[database].cursor()
+                    cursor.row_factory = row_factory(record)
+                    cursor.execute(f"SELECT {columns(record)} FROM {table} ORDER BY rowid")
+                    while True:
+                        rows = cursor.fetchmany(batch_size)
+                        if not rows:
+                            break
+                        out.writelines(_export_line(kind, row) for row in rows)
+                        counts[kind] += len(rows)
+            out.write(json.dumps({'type': 'end', 'counts': counts}) + '\n')
+    finally:
+        for conn in conns.values():
+            conn.rollback()
+            conn.close()
+    return counts
+
+
+def _import_row(kind, record, line):
+    values = [line[field] for field in record._fields]
+    if kind == 'user':
+        values[record._fields.index('password')] = line['password'].encode('ascii')
+    return values
+
+
+def import_data(storage, path, batch_size=1000):
+    """loading an NDJSON export into the database, returns the counts
+
+    Rows keep their IDs. Raises ValueError for a malformed file or rows that
+    clash with existing ones, nothing is imported then. (With a sharded
+    storage each database commits on its own, the catalog first - a crash
+    between those commits can leave users without their characters, never
+    characters without their user.)
+    """
+    tables = {kind: (table, record) for kind, table, record in EXPORT_TABLES}
+    inserts = {
+        kind: f"INSERT INTO {table} ({columns(record)}) VALUES ({', '.join('?' * len(record._fields))})"
+        for kind, (table, record) in tables.items()
+    }
+    counts = {kind: 0 for kind in tables}
+    batches = {kind: {} for kind in tables}  # kind -> database -> rows
+    pending = {kind: 0 for kind in tables}
+    character_shards = {}  # character ID -> shard, for the characters of this file
+    expected = None
+
+    conns = {database: database.connect() for database in dict.fromkeys((storage.catalog, *storage.shards))}
+    line_number = 0
+
+    def flush(kind):
+        for database, rows in batches[kind].items():
+            conns[database].executemany(inserts[kind], rows)
+        counts[kind] += pending[kind]
+        batches[kind].clear()
+        pending[kind] = 0
+
+    def database_for(kind, line):
+        if kind == 'user':
+            return storage.catalog
+        if kind == 'character':
+            shard = storage.shard_for_user(line['user_id'])
+            character_shards[line['id']] = shard
+            return shard
+        shard = character_shards.get(line['character_id']) or storage.shard_for_character(line['character_id'])
+        if shard is None:
+            raise ValueError(f"Save {line['id']} belongs to the unknown character {line['character_id']}.")
+        return shard
+
+    try:
+        last_save_rowids = {}
+        for database, conn in conns.items():
+            conn.isolation_level = None
+            conn.execute("BEGIN IMMEDIATE")
+        # the search index is filled once at the end instead of by a trigger per row -
+        # other connections only ever see the triggers in place, the schema change
+        # is part of this transaction
+        for database in storage.shards:
+            conn = conns[database]
+            last_save_rowids[database] = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM save_games").fetchone()[0]
+            database.drop_search_triggers(conn)
+        with _open(path, 'r') as lines:
+            header = json.loads(next(lines, 'null'))
+            line_number = 1
+            if not header or header.get('format') != EXPORT_FORMAT or header.get('version') != EXPORT_VERSION:
+                raise ValueError(f"{path} is not a version {EXPORT_VERSION} {EXPORT_FORMAT} file.")
+            for line_number, text in enumerate(lines, start=2):
+                line = json.loads(text)
+                kind = line.get('type')
+                if kind == 'end':
+                    expected = line['counts']
+                    break
+                if kind not in tables:
+                    raise ValueError(f"Unknown line type '{kind}'.")
+                # rows go in file order, parents before the rows referencing them
+                for other in tables:
+                    if other != kind and pending[other]:
+                        flush(other)
+                batches[kind].setdefault(database_for(kind, line), []).append(
+                    _import_row(kind, tables[kind][1], line)
+                )
+                pending[kind] += 1
+                if pending[kind] >= batch_size:
+                    flush(kind)
+        for kind, _, _ in EXPORT_TABLES:
+            flush(kind)
+        if expected is None:
+            raise ValueError(f"{path} is truncated, it has no end line.")
+        if expected != counts:
+            raise ValueError(f"{path} announces {expected} rows but holds {counts}.")
+        for database in storage.shards:
+            database.index_saves_for_search(conns[database], last_save_rowids[database])
+            database.create_search_triggers(conns[database])
+        for conn in conns.values():
+            conn.execute("COMMIT")
+    except (ValueError, KeyError, sqlite3.IntegrityError) as e:
+        _rollback(conns.values())
+        raise ValueError(f"Import failed near line {line_number}: {e}") from e
+    except BaseException:
+        _rollback(conns.values())
+        raise
+    finally:
+        for conn in conns.values():
+            conn.close()
+    return counts
+
+
+def _rollback(conns):
+    for conn in conns:
+        if conn.in_transaction:
+            conn.rollback()
+
+
+def register_backup_commands(app, storage):
+    """`flask backup`, `flask export-data` and `flask import-data` for the SQLite storage of an app"""
+    import click
+
+    def require_sqlite():
+        if not hasattr(storage, 'database_paths'):
+            raise click.ClickException("This command needs the 'sqlite' or 'sharded' storage backend.")
+
+    @app.cli.command('backup')
+    @click.argument('target')
+    @click.option('--pages', default=1024, show_default=True, help='Pages copied per step.')
+    @click.option('--pause', default=0.0, show_default=True, help='Seconds to wait between steps.')
+    @click.option('--verify/--no-verify', default=True, show_default=True, help='Check the copy with quick_check.')
+    def backup(target, pages, pause, verify):
+        """copy the live database to TARGET without stopping the app (shards next to it)"""
+        require_sqlite()
+        for source, target_path in backup_targets(storage, target):
+            try:
+                report = backup_database(source, target_path, pages, pause, verify)
+            except sqlite3.Error as e:
+                raise click.ClickException(f"Backing up {source} to {target_path} failed: {e}")
+            click.echo(
+                f"Backed up {report['size_mb']} MB to {report['target']} in {report['seconds']}s "
+                f"({report['mb_per_second']} MB/s, {report['steps']} steps, "
+                f"longest step {report['longest_step_ms']} ms)."
+            )
+
+    @app.cli.command('export-data')
+    @click.argument('path')
+    def export_command(path):
+        """stream users, characters and saves to an NDJSON file (.gz to compress)"""
+        require_sqlite()
+        started = time.monotonic()
+        counts = export_data(storage, path)
+        seconds = time.monotonic() - started
+        rows = sum(counts.values())
+        click.echo(
+            f"Exported {counts['user']} users, {counts['character']} characters and {counts['save']} saves "
+            f"to {path} in {seconds:.2f}s ({rows / seconds if seconds else 0:,.0f} rows/s)."
+        )
+
+    @app.cli.command('import-data')
+    @click.argument('path')
+    @click.option('--batch-size', default=1000, show_default=True, help='Rows per insert batch.')
+    def import_command(path, batch_size):
+        """load an NDJSON export, all or nothing"""
+        require_sqlite()
+        started = time.monotonic()
+        try:
+            counts = import_data(storage, path, batch_size)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        seconds = time.monotonic() - started
+        rows = sum(counts.values())
+        click.echo(
+            f"Imported {counts['user']} users, {counts['character']} characters and {counts['save']} saves "
+            f"in {seconds:.2f}s ({rows / seconds if seconds else 0:,.0f} rows/s)."
+        )
@@ -0,0 +1,106 @@
+"""online backup benchmark - what a running backup costs the writers
+
+A separate process commits small writes (one save game each, like the save
+route) in a loop, while the main process leaves the database alone, then
+backs it up in one step, then step-wise with a pause between steps. Commit
+latency is reported per phase; the backup phases also report throughput and
+the longest single step.
+
+    python benchmarks/bench_backup.py --saves 200000 --pages 1024 --pause 0.01
+"""
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backup import backup_database  # noqa: E402
+from seed import seed_database  # noqa: E402
+from storage import SQLiteStorage  # noqa: E402
+
+
+def prepare_database(path, saves):
+    if os.path.exists(path):
+        return
+    storage = SQLiteStorage(path)
+    storage.init_db()
+    users = max(1, saves // 40)
+    seed_database(storage, users, 4, 10, log=lambda message: None)
+    storage.close()
+
+
+def writer(path, stop, results):
+    """committing one save game at a time until stopped, sends commit latencies in ms"""
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    character_id = conn.execute("SELECT id FROM characters LIMIT 1").fetchone()[0]
+    latencies = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(
+            "INSERT INTO save_games (id, character_id, current_node_id, save_name) VALUES (?, ?, 'start', 'bench')",
+            (str(uuid.uuid4()), character_id)
+        )
+        conn.execute("COMMIT")
+        latencies.append((time.perf_counter() - started) * 1000)
+        time.sleep(0.001)
+    conn.execute("DELETE FROM save_games WHERE save_name = 'bench'")
+    conn.close()
+    results.send(latencies)
+
+
+def run_phase(path, action):
+    stop = multiprocessing.Event()
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=writer, args=(path, stop, sender))
+    process.start()
+    time.sleep(0.5)
+    report = action()
+    stop.set()
+    latencies = receiver.recv()
+    process.join()
+    return report, latencies
+
+
+def summary(latencies):
+    ordered = sorted(latencies)
+    return (f"{len(ordered):6d} commits  p50 {statistics.median(ordered):6.2f} ms  "
+            f"p99 {ordered[int(len(ordered) * 0.99)]:7.2f} ms  max {ordered[-1]:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default='db/bench_backup.db')
+    parser.add_argument('--target', default='db/bench_backup.copy.db')
+    parser.add_argument('--saves', type=int, default=200000)
+    parser.add_argument('--pages', type=int, default=1024)
+    parser.add_argument('--pause', type=float, default=0.01)
+    parser.add_argument('--idle-seconds', type=float, default=3.0)
+    args = parser.parse_args()
+
+    prepare_database(args.database, args.saves)
+    print(f"{os.path.getsize(args.database) / 2 ** 20:.0f} MB database")
+    phases = (
+        ('idle', lambda: time.sleep(args.idle_seconds)),
+        ('one step', lambda: backup_database(args.database, args.target, pages=-1)),
+        (f'{args.pages} pages/step', lambda: backup_database(args.database, args.target, args.pages, args.pause)),
+    )
+    for name, action in phases:
+        report, latencies = run_phase(args.database, action)
+        line = f"{name:<18} {summary(latencies)}"
+        if report:
+            line += (f"   backup {report['seconds']:6.2f} s  {report['mb_per_second']:7.1f} MB/s  "
+                     f"{report['steps']} steps, longest {report['longest_step_ms']:.1f} ms")
+        print(line)
+    os.remove(args.target)
+
+
+if __name__ == '__main__':
+    main()
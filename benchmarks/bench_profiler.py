@@ -0,0 +1,78 @@
+"""request profiler overhead - the game page with profiling off, on and active
+
+Times GET /game for a logged-in player through the Flask test client, in
+three apps on the same database:
+
+* off - PROFILE_ENABLED unset, no hooks registered
+* on, not picked - hooks registered, the request carries no header and is not sampled
+* profiled - every request carries a signed X-Profile header and is written out
+
+    python benchmarks/bench_profiler.py --requests 2000
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from profiler import PROFILE_HEADER  # noqa: E402
+
+
+def logged_in_client(app):
+    client = app.test_client()
+    client.post('/signup', data={'username': 'bench', 'password': 'bench-password'})
+    client.post('/login', data={'username': 'bench', 'password': 'bench-password'})
+    client.post('/character-creation', data={'name': 'Bench', 'race': 'Elf', 'archetype': 'Mage'})
+    return client
+
+
+def timed_us(client, requests, headers):
+    latencies = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        client.get('/game', headers=headers)
+        latencies.append((time.perf_counter() - started) * 1e6)
+    return statistics.median(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default='db/bench_profiler.db')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--interval', type=float, default=0.005)
+    args = parser.parse_args()
+
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(args.database + suffix):
+            os.remove(args.database + suffix)
+    profile_dir = tempfile.mkdtemp(prefix='bench-profiles-')
+    base_config = {'MAINTENANCE_ENABLED': False, 'SECRET_KEY': 'bench'}
+    profiling = dict(base_config, PROFILE_ENABLED=True, PROFILE_DIR=profile_dir, PROFILE_INTERVAL=args.interval)
+    try:
+        off = create_app('sqlite', args.database, config=dict(base_config, PROFILE_ENABLED=False))
+        on = create_app('sqlite', args.database, config=profiling)
+        token = on.extensions['request_profiler'].create_token()
+
+        cases = (
+            ('off', off, {}),
+            ('on, not picked', on, {}),
+            ('profiled', on, {PROFILE_HEADER: token}),
+        )
+        clients = {off: logged_in_client(off), on: logged_in_client(on)}
+        baseline = None
+        for name, app, headers in cases:
+            median = timed_us(clients[app], args.requests, headers)
+            baseline = baseline or median
+            print(f"{name:<16} {median:8.1f} us per request ({median / baseline:.2f}x)")
+        print(f"{len(os.listdir(profile_dir)) // 2} profiles kept in {profile_dir}")
+    finally:
+        shutil.rmtree(profile_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""row models benchmark - named tuple records against dict(row) copies
+
+Times the storage reads behind the game page (character, story node, the
+character's saves) and the load page (all saves of a user), once through the
+record-returning storage and once the old way, a sqlite3.Row per row copied
+into a dict. Memory is what the results of one request keep alive, measured
+with tracemalloc.
+
+    python benchmarks/bench_records.py --saves-per-character 100
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from seed import seed_database  # noqa: E402
+from storage import SQLiteStorage  # noqa: E402
+
+
+def dict_rows(conn, query, params):
+    return [dict(row) for row in conn.execute(query, params).fetchall()]
+
+
+def dict_game_request(conn, character_id, node_id):
+    character = dict_rows(conn, "SELECT * FROM characters WHERE id = ?", (character_id,))[0]
+    node = dict_rows(conn, "SELECT * FROM story_nodes WHERE id = ?", (node_id,))[0]
+    node['choices'] = dict_rows(conn, "SELECT * FROM choices WHERE node_id = ?", (node_id,))
+    saves = dict_rows(conn, "SELECT * FROM save_games WHERE character_id = ? ORDER BY timestamp DESC", (character_id,))
+    return character, node, saves
+
+
+def dict_load_request(conn, user_id):
+    return dict_rows(conn, """
+        SELECT sg.*, c.name AS character_name, c.race, c.archetype, sn.text AS story_text_snippet
+        FROM save_games sg
+        JOIN characters c ON sg.character_id = c.id
+        JOIN story_nodes sn ON sg.current_node_id = sn.id
+        WHERE c.user_id = ?
+        ORDER BY sg.timestamp DESC
+    """, (user_id,))
+
+
+def record_game_request(storage, character_id, node_id):
+    return (
+        storage.get_character(character_id),
+        storage.get_story_node(node_id),
+        storage.get_saves_for_character(character_id),
+    )
+
+
+def record_load_request(storage, user_id):
+    return storage.get_saves_for_user(user_id)
+
+
+def timed_us(fn, repeats):
+    latencies = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - started) * 1e6)
+    return statistics.median(latencies)
+
+
+def retained_bytes(fn):
+    """bytes still allocated by the result of one call"""
+    fn()  # warm caches and statement cache first
+    tracemalloc.start()
+    result = fn()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default='db/bench_records.db')
+    parser.add_argument('--characters-per-user', type=int, default=4)
+    parser.add_argument('--saves-per-character', type=int, default=100)
+    parser.add_argument('--repeats', type=int, default=2000)
+    args = parser.parse_args()
+
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(args.database + suffix):
+            os.remove(args.database + suffix)
+    storage = SQLiteStorage(args.database)
+    storage.init_db()
+    seed_database(storage, 1, args.characters_per_user, args.saves_per_character, log=lambda message: None)
+
+    conn = storage.connection()
+    user_id, character_id = conn.execute("SELECT user_id, id FROM characters LIMIT 1").fetchone()
+    node_id = 'start'
+    cases = (
+        (f'game page ({args.saves_per_character} saves)',
+         lambda: dict_game_request(conn, character_id, node_id),
+         lambda: record_game_request(storage, character_id, node_id)),
+        (f'load page ({args.characters_per_user * args.saves_per_character} saves)',
+         lambda: dict_load_request(conn, user_id),
+         lambda: record_load_request(storage, user_id)),
+    )
+    for name, as_dicts, as_records in cases:
+        dict_us, record_us = timed_us(as_dicts, args.repeats), timed_us(as_records, args.repeats)
+        dict_kb, record_kb = retained_bytes(as_dicts) / 1024, retained_bytes(as_records) / 1024
+        print(f"{name:<24} dicts {dict_us:8.1f} us {dict_kb:8.1f} KB   "
+              f"records {record_us:8.1f} us {record_kb:8.1f} KB   "
+              f"({dict_us / record_us:.2f}x faster, {dict_kb / record_kb:.2f}x smaller)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""save search benchmark - FTS5 index against a LIKE scan
+
+Seeds a fresh database (or reuses one) and times searches of random seeded
+users with both approaches, plus a heavy player holding --heavy-saves saves:
+
+    python benchmarks/bench_search.py --users 100000 --characters-per-user 2 --saves-per-character 10
+
+100000 x 2 x 10 gives two million saves.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from seed import seed_database  # noqa: E402
+from storage import SQLiteStorage  # noqa: E402
+
+QUERIES = ('elysia', 'guardian threshold', 'altar', 'fen save', 'runes', 'moonlight clearing', 'mor', 'you', 'save', 'a')
+
+LIKE_QUERY = """
+    SELECT sg.*, c.name AS character_name, c.race, c.archetype, sn.text AS story_text_snippet
+    FROM save_games sg
+    JOIN characters c ON sg.character_id = c.id
+    JOIN story_nodes sn ON sg.current_node_id = sn.id
+    WHERE c.user_id = ? AND (sg.save_name LIKE ? OR c.name LIKE ? OR sn.text LIKE ?)
+    ORDER BY sg.timestamp DESC
+    LIMIT 21
+"""
+
+LIKE_ALL_USERS_QUERY = """
+    SELECT sg.id
+    FROM save_games sg
+    JOIN story_nodes sn ON sg.current_node_id = sn.id
+    WHERE sn.text LIKE ?
+    LIMIT 21
+"""
+
+
+def timed(fn, repeats):
+    """latencies of repeated calls, in milliseconds"""
+    latencies = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def summary(name, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if len(latencies) >= 20 else latencies[-1]
+    print(f"{name:<32} p50 {statistics.median(latencies):8.3f} ms   p95 {p95:8.3f} ms   max {latencies[-1]:8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default='db/bench_search.db')
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--characters-per-user', type=int, default=2)
+    parser.add_argument('--saves-per-character', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--heavy-saves', type=int, default=50000, help='saves of one extra heavy player, 0 for none')
+    parser.add_argument('--repeats', type=int, default=200)
+    parser.add_argument('--reuse', action='store_true', help='keep an already seeded database')
+    args = parser.parse_args()
+
+    if not args.reuse and os.path.exists(args.database):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.database + suffix):
+                os.remove(args.database + suffix)
+
+    storage = SQLiteStorage(args.database)
+    storage.init_db()
+    conn = storage.connection()
+    if not args.reuse:
+        seed_database(storage, args.users, args.characters_per_user, args.saves_per_character, seed=args.seed,
+                      log=lambda message: None)
+        if args.heavy_saves:
+            seed_database(storage, 1, 5, args.heavy_saves // 5, seed=args.seed + 1, log=lambda message: None)
+
+    saves = conn.execute("SELECT COUNT(*) FROM save_games").fetchone()[0]
+    size_mb = os.path.getsize(args.database) / (1024 * 1024)
+    print(f"{saves:,} saves, database {size_mb:,.1f} MB")
+
+    user_ids = [row[0] for row in conn.execute("SELECT id FROM users ORDER BY random() LIMIT 1000")]
+    heavy_user_id = conn.execute("SELECT id FROM users WHERE username = ?", (f"seed{args.seed + 1}_0",)).fetchone()
+    rng = random.Random(args.seed)
+
+    def fts_search(user_ids=user_ids):
+        storage.search_saves(rng.choice(user_ids), rng.choice(QUERIES), limit=21)
+
+    def like_search(user_ids=user_ids):
+        query = rng.choice(QUERIES).split()[0]
+        pattern = f"%{query}%"
+        conn.execute(LIKE_QUERY, (rng.choice(user_ids), pattern, pattern, pattern)).fetchall()
+
+    def like_all_users():
+        conn.execute(LIKE_ALL_USERS_QUERY, (f"%{rng.choice(QUERIES).split()[0]}%zzz%",)).fetchall()
+
+    summary('FTS5 search (per user)', timed(fts_search, args.repeats))
+    summary('LIKE search (per user)', timed(like_search, args.repeats))
+    if heavy_user_id:
+        heavy = [heavy_user_id[0]]
+        summary('FTS5 search (heavy user)', timed(lambda: fts_search(heavy), args.repeats))
+        summary('LIKE search (heavy user)', timed(lambda: like_search(heavy), args.repeats))
+    for query in QUERIES:
+        summary(f"FTS5 '{query}'", timed(lambda: storage.search_saves(rng.choice(user_ids), query, limit=21),
+                                           max(3, args.repeats // 10)))
+    # a LIKE over story text without the user filter has to scan every save
+    summary('LIKE scan (all saves, no match)', timed(like_all_users, max(3, args.repeats // 50)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""write throughput of concurrent writer processes, one database file against shards
+
+Each writer process has its own storage (as a gunicorn worker would) and
+saves games for random characters through create_save as fast as it can.
+Every save is a write transaction, and each SQLite file allows one writer
+at a time. With a single file every process queues for the same lock, with
+shards only the writers that land on the same shard do.
+
+    python benchmarks/bench_shards.py --writers 8 --shards 1 2 4 8 --synchronous FULL
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import StorageError, create_storage  # noqa: E402
+
+
+def open_storage(directory, shard_count, synchronous):
+    backend = 'sharded' if shard_count else 'sqlite'
+    storage = create_storage(backend, os.path.join(directory, 'bench.db'), shard_count or 1)
+    for database in dict.fromkeys((storage.catalog, *storage.shards)):
+        database.connection().execute(f"PRAGMA synchronous = {synchronous}")
+    return storage
+
+
+def prepare(directory, shard_count, players):
+    """users with a character each, returns the character IDs"""
+    storage = open_storage(directory, shard_count, 'OFF')
+    storage.init_db()
+    character_ids = []
+    for i in range(players):
+        user_id = storage.create_user(f"writer{i}", b'-')
+        character_id = str(uuid.uuid4())
+        storage.create_character(character_id, user_id, f"Writer {i}", 'Elf', 'Mage')
+        character_ids.append(character_id)
+    storage.close()
+    return character_ids
+
+
+def writer(directory, shard_count, synchronous, character_ids, seconds, barrier, results, seed):
+    storage = open_storage(directory, shard_count, synchronous)
+    rng = random.Random(seed)
+    # every character's shard is looked up once, before the clock starts
+    for character_id in character_ids:
+        storage.get_character(character_id)
+    latencies, errors = [], 0
+    barrier.wait()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            storage.create_save(str(uuid.uuid4()), rng.choice(character_ids), 'start', 'bench')
+            latencies.append((time.perf_counter() - started) * 1000)
+        except StorageError:
+            errors += 1
+    storage.close()
+    results.put((latencies, errors))
+
+
+def measure(shard_count, args):
+    directory = tempfile.mkdtemp(prefix='bench-shards-', dir=args.directory)
+    try:
+        character_ids = prepare(directory, shard_count, args.players)
+        barrier = multiprocessing.Barrier(args.writers)
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target=writer, args=(
+                directory, shard_count, args.synchronous, character_ids, args.seconds, barrier, results, seed
+            ))
+            for seed in range(args.writers)
+        ]
+        for process in processes:
+            process.start()
+        latencies, errors = [], 0
+        for _ in processes:
+            process_latencies, process_errors = results.get()
+            latencies += process_latencies
+            errors += process_errors
+        for process in processes:
+            process.join()
+        return latencies, errors
+    finally:
+        shutil.rmtree(directory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--writers', type=int, default=8, help='Writer processes.')
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help='Shard counts to compare with the single database.')
+    parser.add_argument('--players', type=int, default=1000)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--directory', help='Where the databases are created, the temp directory by default.')
+    parser.add_argument('--synchronous', default='NORMAL', choices=('OFF', 'NORMAL', 'FULL'),
+                        help='FULL syncs every commit to disk.')
+    args = parser.parse_args()
+
+    print(f"{args.writers} writer processes, {args.seconds:g}s each, synchronous={args.synchronous}, "
+          f"{os.cpu_count()} CPUs")
+    baseline = None
+    for shard_count in [0] + args.shards:
+        latencies, errors = measure(shard_count, args)
+        throughput = len(latencies) / args.seconds
+        baseline = baseline or throughput
+        ordered = sorted(latencies)
+        name = f"{shard_count} shards" if shard_count else 'single file'
+        print(f"{name:<12} {throughput:8.0f} saves/s ({throughput / baseline:.2f}x)   "
+              f"p50 {statistics.median(ordered):7.2f} ms   p99 {ordered[int(len(ordered) * 0.99)]:7.2f} ms   "
+              f"{errors} failed")
+
+
+if __name__ == '__main__':
+    main()
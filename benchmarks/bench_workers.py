@@ -0,0 +1,147 @@
+"""per-worker memory of the gunicorn setup, with and without preload_app
+
+Starts gunicorn (gunicorn.conf.py, wsgi:app) twice on a database with a
+large synthetic story, sends some traffic to every worker and reads the
+workers' memory from /proc/<pid>/smaps_rollup (Linux only):
+
+* RSS - resident pages, shared ones counted in full for every process
+* PSS - shared pages split between the processes sharing them
+* USS - pages only this process uses (what killing it would free)
+
+    python benchmarks/bench_workers.py --workers 4 --story-nodes 20000
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from seed import seed_database  # noqa: E402
+from storage import SQLiteStorage  # noqa: E402
+
+PATHS = ('/', '/login', '/signup', '/healthz', '/game')
+
+
+def prepare_database(path, story_nodes):
+    if os.path.exists(path):
+        return
+    storage = SQLiteStorage(path)
+    storage.init_db()
+    seed_database(storage, 0, 0, 0, story_nodes=story_nodes, log=lambda message: None)
+    storage.close()
+
+
+def child_pids(parent_pid):
+    """PIDs of the direct children of a process"""
+    pids = []
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat') as f:
+                # the command name may hold spaces, fields after it are fixed
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == parent_pid:
+            pids.append(int(name))
+    return pids
+
+
+def memory_kb(pid):
+    """RSS, PSS and USS of a process in kB"""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                values[parts[0].rstrip(':')] = int(parts[1])
+    return {
+        'rss': values['Rss'],
+        'pss': values['Pss'],
+        'uss': values['Private_Clean'] + values['Private_Dirty'],
+    }
+
+
+def get(url):
+    try:
+        with urllib.request.urlopen(url, timeout=10) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def wait_until_serving(base_url, master, workers, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if master.poll() is not None:
+            raise RuntimeError('gunicorn exited during startup')
+        try:
+            if get(base_url + '/healthz') == 200 and len(child_pids(master.pid)) >= workers:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError('gunicorn did not start in time')
+
+
+def measure(preload, args):
+    env = dict(
+        os.environ,
+        DATABASE_PATH=os.path.abspath(args.database),
+        MAINTENANCE_ENABLED='0',
+        SECRET_KEY='bench',
+        GUNICORN_PRELOAD='1' if preload else '0',
+        GUNICORN_WORKERS=str(args.workers),
+        GUNICORN_BIND=f'127.0.0.1:{args.port}',
+        GUNICORN_ACCESS_LOG='/dev/null',
+    )
+    master = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f'http://127.0.0.1:{args.port}'
+    try:
+        wait_until_serving(base_url, master, args.workers)
+        # enough traffic that every worker serves every page
+        for i in range(args.requests):
+            get(base_url + PATHS[i % len(PATHS)])
+        time.sleep(0.5)
+        workers = [memory_kb(pid) for pid in child_pids(master.pid)]
+        return memory_kb(master.pid), workers
+    finally:
+        master.send_signal(signal.SIGTERM)
+        master.wait(timeout=60)
+
+
+def report(name, master, workers):
+    average = {key: sum(worker[key] for worker in workers) / len(workers) / 1024 for key in ('rss', 'pss', 'uss')}
+    total_pss = (master['pss'] + sum(worker['pss'] for worker in workers)) / 1024
+    print(f"{name:<12} per worker: RSS {average['rss']:7.1f} MB   PSS {average['pss']:7.1f} MB   "
+          f"USS {average['uss']:7.1f} MB   |   all processes PSS {total_pss:7.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default='db/bench_workers.db')
+    parser.add_argument('--story-nodes', type=int, default=20000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--port', type=int, default=8123)
+    args = parser.parse_args()
+
+    prepare_database(args.database, args.story_nodes)
+    print(f"{args.workers} workers, {args.story_nodes} synthetic story nodes, {args.requests} requests")
+    for preload in (False, True):
+        master, workers = measure(preload, args)
+        report('preload' if preload else 'no preload', master, workers)
+
+
+if __name__ == '__main__':
+    main()
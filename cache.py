@@ -0,0 +1,170 @@
+"""cross-request caches for records that rarely change
+
+Characters never change once created and save lists change only when a
+player saves or deletes, so both are kept in bounded LRU caches keyed by ID.
+Routes invalidate entries explicitly after a write. Save lists are also
+stamped with a version kept in the database, checked on every hit, so a save
+or delete handled by another worker process shows up at once. Within one
+request, repeated lookups share the same result through a memo on flask.g.
+
+Cached values are shared between requests and must not be mutated.
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g
+
+_MISSING = object()
+
+
+def deep_sizeof(obj, _seen=None):
+    """approximate memory used by an object and everything it holds"""
+    seen = _seen if _seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(key, seen) + deep_sizeof(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif hasattr(obj, '__slots__'):
+        size += sum(deep_sizeof(getattr(obj, slot), seen) for slot in obj.__slots__ if hasattr(obj, slot))
+    return size
+
+
+class LRUCache:
+    """thread-safe LRU cache with an entry limit and an optional TTL"""
+
+    def __init__(self, name, max_entries=1024, ttl=None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl  # seconds, None keeps entries until evicted or invalidated
+        self._entries = OrderedDict()  # key -> (value, size, expires, version)
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale = 0
+
+    def get(self, key, default=None, version=None):
+        """cached value, default when missing, expired or cached at another version"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] is not None and entry[2] < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is not None and entry[3] != version:
+                self._remove(key)
+                self.stale += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, version=None):
+        size = deep_sizeof(value)
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, expires, version)
+            self._bytes += size
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        _, size, _, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self):
+        """hit ratio and memory use of the cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'stale': self.stale,
+                'approx_bytes': self._bytes,
+            }
+
+
+class RecordCache:
+    """named LRU caches plus a per-request memo on flask.g"""
+
+    def __init__(self, caches):
+        self.caches = {cache.name: cache for cache in caches}
+
+    def _request_memo(self):
+        memo = g.get('_record_cache_memo')
+        if memo is None:
+            memo = g._record_cache_memo = {}
+        return memo
+
+    def lookup(self, name, key, loader, version=None):
+        """cached value, loaded (and cached) on a miss - None results are not cached
+
+        version(key) gives the current version of the record, a cached value
+        of another version is reloaded. When it returns None the version is
+        unknown, and the value is loaded without touching the cache.
+        """
+        memo = self._request_memo()
+        value = memo.get((name, key), _MISSING)
+        if value is not _MISSING:
+            return value
+
+        cache = self.caches[name]
+        current = version(key) if version is not None else None
+        if version is not None and current is None:
+            value = loader(key)
+        else:
+            value = cache.get(key, _MISSING, current)
+            if value is _MISSING:
+                value = loader(key)
+                if value is not None:
+                    cache.set(key, value, current)
+        memo[(name, key)] = value
+        return value
+
+    def invalidate(self, name, key):
+        """dropping an entry from the cache and from the current request's memo"""
+        self.caches[name].invalidate(key)
+        self._request_memo().pop((name, key), None)
+
+    def stats(self):
+        return {name: cache.stats() for name, cache in self.caches.items()}
+
+
+def create_record_cache(config):
+    """record cache from the app config"""
+    return RecordCache([
+        LRUCache('characters', max_entries=config['CHARACTER_CACHE_SIZE']),
+        # checked against the save list version on every hit, the TTL only bounds memory use
+        LRUCache('save_lists', max_entries=config['SAVE_LIST_CACHE_SIZE'], ttl=config['SAVE_LIST_CACHE_TTL']),
+    ])
@@ -0,0 +1,173 @@
+"""pre-generated story segments for dice rolls that miss their deadline
+
+A roll waits for Ollama at most ROLL_DEADLINE_SECONDS. When generation is
+late or fails, the player gets a segment from the fallback pool instead,
+matched as closely as the pool allows:
+
+* exact - same story node, race and archetype
+* node - same story node, any race or archetype
+* generic - a segment written for any point of the dynamic story ('dynamic'),
+  same race and archetype, then any race or archetype
+* builtin - BUILTIN_SEGMENT, when the pool has nothing at all
+
+The pool is filled offline by `flask refill-fallback-pool`, which only calls
+Ollama while no dice roll is in flight.
+"""
+import threading
+import time
+from collections import deque
+
+from story_content import ARCHETYPES, RACES
+
+# node ID of LLM generated segments, generic pool segments are stored under it
+DYNAMIC_NODE_ID = 'dynamic'
+
+# story context for generic segments, which may follow any dynamic segment
+DYNAMIC_CONTEXT = (
+    'You have wandered beyond the known paths of the Whispering Woods. The trees shift around you, '
+    'and the strange colored light flickers somewhere ahead, always just out of reach.'
+)
+
+# last resort, so a roll never ends without a story
+BUILTIN_SEGMENT = {
+    'node_id': DYNAMIC_NODE_ID,
+    'race': None,
+    'archetype': None,
+    'story_text': (
+        'The dice tumble through the air and vanish into the mist before they land. For a moment the '
+        'Whispering Woods hold their breath. Then the trees part, revealing three paths you are certain '
+        'were not there before: one lit by drifting blue motes, one descending into a hollow filled with '
+        'soft music, and one climbing toward a ridge where the colored light flickers again.'
+    ),
+    'choices': [
+        'Follow the drifting blue motes',
+        'Descend into the musical hollow',
+        'Climb toward the flickering light on the ridge',
+    ],
+}
+
+FALLBACK_LEVELS = ('exact', 'node', 'generic', 'builtin')
+
+
+class RollStats:
+    """thread-safe counters for dice roll generation and fallbacks"""
+
+    def __init__(self, history=1000):
+        self._lock = threading.Lock()
+        self.rolls = 0
+        self.generated = 0
+        self.deadline_misses = 0
+        self.generation_errors = 0
+        self.late_completions = 0
+        self.fallbacks = {level: 0 for level in FALLBACK_LEVELS}
+        self._latencies = deque(maxlen=history)  # seconds, rolls served by Ollama in time
+
+    def record_generated(self, latency):
+        with self._lock:
+            self.rolls += 1
+            self.generated += 1
+            self._latencies.append(latency)
+
+    def record_fallback(self, level, deadline_missed):
+        with self._lock:
+            self.rolls += 1
+            self.fallbacks[level] += 1
+            if deadline_missed:
+                self.deadline_misses += 1
+            else:
+                self.generation_errors += 1
+
+    def record_late_completion(self, future):
+        """done callback of a generation that missed its deadline"""
+        with self._lock:
+            self.late_completions += 1
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            fallbacks = sum(self.fallbacks.values())
+            return {
+                'rolls': self.rolls,
+                'generated': self.generated,
+                'fallbacks': fallbacks,
+                'fallback_rate': round(fallbacks / self.rolls, 4) if self.rolls else 0.0,
+                'fallbacks_by_match': dict(self.fallbacks),
+                'deadline_misses': self.deadline_misses,
+                'deadline_miss_rate': round(self.deadline_misses / self.rolls, 4) if self.rolls else 0.0,
+                'generation_errors': self.generation_errors,
+                # generations that missed the deadline and have finished since
+                'late_completions': self.late_completions,
+                'generation_p50_ms': _percentile_ms(latencies, 0.5),
+                'generation_p95_ms': _percentile_ms(latencies, 0.95),
+            }
+
+
+def _percentile_ms(latencies, fraction):
+    if not latencies:
+        return None
+    return round(latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000, 1)
+
+
+def pick_fallback_segment(storage, node_id, race=None, archetype=None):
+    """closest pool segment for a roll, and the level it matched at"""
+    # without a known race and archetype only the node-wide lookups apply
+    has_character = race is not None and archetype is not None
+    node_ids = [node_id] if node_id == DYNAMIC_NODE_ID else [node_id, DYNAMIC_NODE_ID]
+    lookups = []
+    for lookup_node_id in node_ids:
+        specific, anyone = ('exact', 'node') if lookup_node_id == node_id else ('generic', 'generic')
+        if has_character:
+            lookups.append((specific, lookup_node_id, race, archetype))
+        lookups.append((anyone, lookup_node_id, None, None))
+    for level, lookup_node_id, lookup_race, lookup_archetype in lookups:
+        segment = storage.get_fallback_segment(lookup_node_id, lookup_race, lookup_archetype)
+        if segment:
+            return segment, level
+    return BUILTIN_SEGMENT, 'builtin'
+
+
+def refill_targets(story_graph):
+    """(node_id, race, archetype) combinations the pool should cover
+
+    Rolls start on the story graph's roll nodes and continue from dynamic
+    segments, so those are the nodes that need segments.
+    """
+    node_ids = sorted(story_graph.roll_nodes) + [DYNAMIC_NODE_ID]
+    return [(node_id, race, archetype) for node_id in node_ids for race in RACES for archetype in ARCHETYPES]
+
+
+def refill_fallback_pool(storage, targets, per_target, generate, is_idle, poll=2.0, limit=None, max_failures=5,
+                         log=print):
+    """generating segments until every target has per_target of them, returns a summary dict
+
+    generate(node_id, race, archetype) returns (story_text, choices) or
+    raises, is_idle() tells whether Ollama is free for a pool generation.
+    """
+    counts = storage.count_fallback_segments()
+    missing = [(target, per_target - counts.get(target, 0)) for target in targets]
+    missing = [(target, count) for target, count in missing if count > 0]
+    summary = {'targets': len(targets), 'missing': sum(count for _, count in missing), 'added': 0, 'failed': 0}
+
+    failures_in_row = 0
+    for (node_id, race, archetype), count in missing:
+        for _ in range(count):
+            if limit is not None and summary['added'] >= limit:
+                return summary
+            # players come first - pool generations wait until no roll is in flight
+            while not is_idle():
+                time.sleep(poll)
+            try:
+                story_text, choices = generate(node_id, race, archetype)
+            except Exception as e:
+                summary['failed'] += 1
+                failures_in_row += 1
+                log(f"Fallback segment for {node_id} / {race} {archetype} failed: {e}")
+                if failures_in_row >= max_failures:
+                    log(f"Stopping after {failures_in_row} failed generations in a row.")
+                    return summary
+                continue
+            failures_in_row = 0
+            storage.add_fallback_segment(node_id, race, archetype, story_text, choices)
+            summary['added'] += 1
+            log(f"Added fallback segment {summary['added']}/{summary['missing']} for {node_id} / {race} {archetype}")
+    return summary
@@ -0,0 +1,40 @@
+"""gunicorn settings - `gunicorn -c gunicorn.conf.py wsgi:app`
+
+Every setting can be overridden from the environment (GUNICORN_*).
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+# the app is built once in the master and shared copy-on-write by the workers
+# (code changes then need a full restart, a HUP only replaces the workers)
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+# a process per core for CPU work (bcrypt, templates), threads for waiting on
+# Ollama and SQLite - at least two workers, so one can restart while the other serves
+workers = int(os.environ.get('GUNICORN_WORKERS', max(2, multiprocessing.cpu_count())))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# dice roll admission keeps its state in-process unless DICE_ADMISSION_DB is
+# set, which would turn the global cap into one cap per worker - several
+# workers share a file next to the database instead (set it empty to opt out)
+if workers > 1 and 'DICE_ADMISSION_DB' not in os.environ:
+    database_dir = os.path.dirname(os.environ.get('DATABASE_PATH', 'db/mystical_tale.db'))
+    os.environ['DICE_ADMISSION_DB'] = os.path.join(database_dir, 'admission.db')
+if workers > 1 and not os.environ['DICE_ADMISSION_DB']:
+    print(f"Warning: DICE_ADMISSION_DB is empty, each of the {workers} workers admits "
+          f"up to DICE_MAX_CONCURRENT rolls on its own.")
+
+# a dice roll waits up to ROLL_DEADLINE_SECONDS, workers get well past that
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+# requests in flight get this long to finish on a restart or shutdown
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+# recycling workers bounds slow memory growth, the jitter keeps them from restarting together
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
@@ -0,0 +1,368 @@
+"""background maintenance of the SQLite database
+
+An in-process scheduler wakes up every few seconds and runs the tasks that
+are due:
+
+* checkpoint - passive WAL checkpoint, never waits for readers or writers
+* optimize - PRAGMA optimize with a bounded analysis, refreshes statistics
+* vacuum - incremental vacuum, returns free pages to the file system
+* orphans - deletes characters without a user and saves without a character
+  (on shards of a sharded storage, users are looked up in the catalog)
+
+Databases created before auto_vacuum was set to INCREMENTAL never return
+free pages. `flask maintenance --task convert-vacuum` converts them once with
+a full VACUUM, which rewrites the file and blocks writers while it runs.
+
+Heavy tasks (vacuum, orphans) only run inside the low-traffic window and
+while no request is in flight. Everything runs in small steps, each its own
+short transaction, sized to a time budget, so the write lock is never held
+long enough to stall requests. Only one process per database runs
+maintenance at a time (a lock file next to the database). The latest reports
+are kept in a JSON file next to it, so every worker process can serve them.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # not on Windows, where one process is assumed
+    fcntl = None
+
+
+class RequestActivity:
+    """cheap tracking of requests in flight, for idle checks"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.last_request = 0.0
+
+    def started(self):
+        with self._lock:
+            self.in_flight += 1
+            self.last_request = time.monotonic()
+
+    def finished(self):
+        with self._lock:
+            self.in_flight -= 1
+            self.last_request = time.monotonic()
+
+    def idle_for(self):
+        """seconds since the last request, 0 while one is in flight"""
+        with self._lock:
+            if self.in_flight:
+                return 0.0
+            return time.monotonic() - self.last_request
+
+
+def parse_window(window):
+    """'02:00-05:00' -> (120, 300) minutes of the day, None for no window"""
+    if not window:
+        return None
+
+    def to_minutes(value):
+        hours, minutes = value.strip().split(':')
+        return int(hours) * 60 + int(minutes)
+
+    start, end = window.split('-')
+    return to_minutes(start), to_minutes(end)
+
+
+def in_window(window, now=None):
+    """whether the local time falls inside a window, windows may wrap midnight"""
+    if window is None:
+        return True
+    now = now or datetime.now()
+    minute = now.hour * 60 + now.minute
+    start, end = window
+    if start <= end:
+        return start <= minute < end
+    return minute >= start or minute < end
+
+
+class StepSizer:
+    """adapts the size of a step to keep each one near the time budget"""
+
+    def __init__(self, size, minimum, maximum):
+        self.size = size
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def update(self, elapsed, budget):
+        if elapsed > budget:
+            self.size = max(self.minimum, self.size // 2)
+        elif elapsed < budget / 4:
+            self.size = min(self.maximum, self.size * 2)
+
+
+class DatabaseMaintenance:
+    """the maintenance tasks for one SQLite database"""
+
+    # orphan checks - table, parent table, child column, parent column
+    ORPHAN_CHECKS = (
+        ('characters', 'users', 'user_id', 'id'),
+        ('save_games', 'characters', 'character_id', 'id'),
+    )
+
+    def __init__(self, database_path, step_budget=0.05, run_budget=2.0, users_database_path=None):
+        self.database_path = database_path
+        # catalog of a shard - its own users table is empty, the users live there
+        self.users_database_path = users_database_path
+        self.step_budget = step_budget
+        self.run_budget = run_budget
+        self._vacuum_pages = StepSizer(256, 16, 8192)
+        # deleting a character also clears its saves from the search index, so start small
+        self._orphan_rows = StepSizer(100, 10, 100000)
+        # rowid where each orphan scan continues, so runs resume instead of rescanning
+        self._orphan_positions = {table: 0 for table, *_ in self.ORPHAN_CHECKS}
+
+    def connect(self):
+        # short busy timeout, maintenance backs off instead of queueing behind requests
+        conn = sqlite3.connect(self.database_path, timeout=0.1, isolation_level=None)
+        conn.execute("PRAGMA synchronous = NORMAL")
+        if self.users_database_path:
+            conn.execute("ATTACH DATABASE ? AS catalog", (self.users_database_path,))
+        return conn
+
+    def checkpoint(self, conn, deadline):
+        busy, wal_pages, checkpointed = conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+        return {'steps': 1, 'wal_pages': wal_pages, 'checkpointed_pages': checkpointed, 'busy': bool(busy)}
+
+    def optimize(self, conn, deadline):
+        # analysis_limit bounds how many rows ANALYZE reads per index
+        conn.execute("PRAGMA analysis_limit = 400")
+        conn.execute("PRAGMA optimize")
+        return {'steps': 1}
+
+    def vacuum(self, conn, deadline):
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            return {'steps': 0, 'skipped': 'auto_vacuum is not INCREMENTAL, run the convert-vacuum task once'}
+
+        steps = 0
+        free_before = free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        while free and time.monotonic() < deadline:
+            started = time.monotonic()
+            # the pragma frees one page per result row, it only runs as far as it is stepped
+            conn.execute(f"PRAGMA incremental_vacuum({min(free, self._vacuum_pages.size)})").fetchall()
+            self._vacuum_pages.update(time.monotonic() - started, self.step_budget)
+            steps += 1
+            free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return {'steps': steps, 'pages_reclaimed': free_before - free, 'free_pages_left': free}
+
+    def convert_vacuum(self, conn, deadline):
+        """one-off switch to incremental auto-vacuum, a full VACUUM that ignores the run budget"""
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return {'steps': 0, 'skipped': 'auto_vacuum is already INCREMENTAL'}
+        pages_before = conn.execute("PRAGMA page_count").fetchone()[0]
+        # the rewrite needs the write lock, waiting for requests instead of backing off
+        conn.execute("PRAGMA busy_timeout = 30000")
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        pages_after = conn.execute("PRAGMA page_count").fetchone()[0]
+        converted = conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+        return {'steps': 1, 'converted': converted, 'pages_before': pages_before, 'pages_after': pages_after}
+
+    def orphans(self, conn, deadline):
+        steps = 0
+        deleted = {}
+        for table, parent, column, parent_column in self.ORPHAN_CHECKS:
+            if parent == 'users' and self.users_database_path:
+                parent = 'catalog.users'
+            deleted[table] = 0
+            max_rowid = conn.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {table}").fetchone()[0]
+            position = self._orphan_positions[table]
+            while position < max_rowid and time.monotonic() < deadline:
+                # one rowid range per transaction, a range scan on the primary b-tree
+                upper = position + self._orphan_rows.size
+                started = time.monotonic()
+                cursor = conn.execute(f"""
+                    DELETE FROM {table}
+                    WHERE rowid > ? AND rowid <= ?
+                      AND NOT EXISTS (SELECT 1 FROM {parent} p WHERE p.{parent_column} = {table}.{column})
+                """, (position, upper))
+                self._orphan_rows.update(time.monotonic() - started, self.step_budget)
+                deleted[table] += cursor.rowcount
+                position = upper
+                steps += 1
+            # a finished scan starts over on the next run
+            self._orphan_positions[table] = 0 if position >= max_rowid else position
+        return {'steps': steps, 'deleted': deleted, 'complete': all(p == 0 for p in self._orphan_positions.values())}
+
+    def run(self, task):
+        """running one task within the run budget, returns its report"""
+        started_at = datetime.now().isoformat(timespec='seconds')
+        started = time.monotonic()
+        report = {'task': task, 'database': self.database_path, 'started_at': started_at}
+        conn = self.connect()
+        try:
+            report.update(getattr(self, task.replace('-', '_'))(conn, started + self.run_budget))
+        except sqlite3.OperationalError as e:
+            # most likely 'database is locked', the task is simply retried later
+            report['error'] = str(e)
+        finally:
+            conn.close()
+        report['duration_ms'] = round((time.monotonic() - started) * 1000, 2)
+        return report
+
+
+class MaintenanceScheduler:
+    """background thread running DatabaseMaintenance tasks when they are due"""
+
+    # in running order - pages freed by the orphan cleanup are reclaimed right after
+    TASKS = ('orphans', 'vacuum', 'optimize', 'checkpoint')
+    HEAVY_TASKS = ('vacuum', 'orphans')
+    # never scheduled, only run from the command line
+    ONE_OFF_TASKS = ('convert-vacuum',)
+
+    def __init__(self, maintenances, intervals, activity=None, window=None, idle_seconds=1.0, tick=5.0,
+                 history=50, log=print):
+        self.maintenances = maintenances
+        self.intervals = intervals  # task -> seconds, 0 disables a task
+        self.activity = activity
+        self.window = parse_window(window)
+        self.idle_seconds = idle_seconds
+        self.tick = tick
+        self.history = history
+        self.reports = deque(maxlen=history)
+        self.reports_path = maintenances[0].database_path + '.maintenance.json'
+        self.log = log
+        self._last_run = {task: 0.0 for task in self.TASKS}
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock_file = None
+
+    # --- single runner per database ---
+
+    def _acquire_process_lock(self):
+        """only one process per database runs maintenance"""
+        if fcntl is None:
+            return True
+        if self._lock_file is None:
+            self._lock_file = open(self.maintenances[0].database_path + '.maintenance.lock', 'a')
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+
+    # --- scheduling ---
+
+    def due_tasks(self, now=None):
+        now = now if now is not None else time.monotonic()
+        due = []
+        for task in self.TASKS:
+            interval = self.intervals.get(task, 0)
+            if not interval or now - self._last_run[task] < interval:
+                continue
+            if task in self.HEAVY_TASKS:
+                if not in_window(self.window):
+                    continue
+                if self.activity is not None and self.activity.idle_for() < self.idle_seconds:
+                    continue
+            due.append(task)
+        return due
+
+    def run_tasks(self, tasks):
+        """running tasks on every database now, returns the reports"""
+        reports = []
+        for task in tasks:
+            for maintenance in self.maintenances:
+                try:
+                    report = maintenance.run(task)
+                except Exception as e:
+                    print(f"Error in maintenance task {task}: {e}")
+                    print(traceback.format_exc())
+                    report = {'task': task, 'database': maintenance.database_path, 'error': str(e)}
+                self.reports.append(report)
+                reports.append(report)
+                self.log(f"Maintenance: {format_report(report)}")
+            self._last_run[task] = time.monotonic()
+        if reports:
+            self._save_reports(reports)
+        return reports
+
+    # --- reports shared between processes ---
+
+    def _save_reports(self, reports):
+        """appending reports to the shared file, keeping the latest history of them"""
+        try:
+            saved = (self.load_reports() + reports)[-self.history:]
+            # written aside and renamed, readers never see a half-written file
+            temp_path = f"{self.reports_path}.{os.getpid()}.tmp"
+            with open(temp_path, 'w') as f:
+                json.dump(saved, f)
+            os.replace(temp_path, self.reports_path)
+        except OSError as e:
+            print(f"Error saving maintenance reports: {e}")
+
+    def load_reports(self):
+        """latest reports of whichever process ran maintenance, oldest first"""
+        try:
+            with open(self.reports_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return list(self.reports)
+        except (OSError, ValueError) as e:
+            print(f"Error loading maintenance reports: {e}")
+            return list(self.reports)
+
+    def _loop(self):
+        while not self._stop.wait(self.tick):
+            tasks = self.due_tasks()
+            if tasks and self._acquire_process_lock():
+                self.run_tasks(tasks)
+
+    def start(self):
+        """starting the background thread, once per process"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        # nothing is due right after startup, the first runs come one interval later
+        self._last_run = {task: time.monotonic() for task in self.TASKS}
+        self._thread = threading.Thread(target=self._loop, name='db-maintenance', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def format_report(report):
+    """one line summary of a task report"""
+    details = ', '.join(
+        f"{key}={value}" for key, value in report.items()
+        if key not in ('task', 'database', 'started_at', 'duration_ms')
+    )
+    return f"{report['task']} on {report['database']} took {report.get('duration_ms', 0)} ms ({details})"
+
+
+def create_maintenance_scheduler(storage, config, activity):
+    """maintenance scheduler for the SQLite storage of an app"""
+    catalog_path = storage.catalog.database_path
+    maintenances = [
+        DatabaseMaintenance(
+            path, config['MAINTENANCE_STEP_BUDGET'], config['MAINTENANCE_RUN_BUDGET'],
+            users_database_path=catalog_path if path != catalog_path else None
+        )
+        for path in storage.database_paths()
+    ]
+    intervals = {
+        'checkpoint': config['MAINTENANCE_CHECKPOINT_INTERVAL'],
+        'optimize': config['MAINTENANCE_OPTIMIZE_INTERVAL'],
+        'vacuum': config['MAINTENANCE_VACUUM_INTERVAL'],
+        'orphans': config['MAINTENANCE_ORPHANS_INTERVAL'],
+    }
+    return MaintenanceScheduler(
+        maintenances,
+        intervals,
+        activity=activity,
+        window=config['MAINTENANCE_WINDOW'],
+        idle_seconds=config['MAINTENANCE_IDLE_SECONDS'],
+        tick=config['MAINTENANCE_TICK'],
+    )
@@ -0,0 +1,77 @@
+"""typed, immutable records returned by the storage backends
+
+Named tuples instead of a dict per row: one compact allocation, no per-row
+key hashing, and safe to share between requests (the record cache and the
+preloaded story content hand out the same instances). Templates read them
+with attribute access like any object.
+
+Field order matches the column lists the SQLite backend selects, so rows are
+turned into records directly by a cursor row factory.
+"""
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+
+class User(NamedTuple):
+    id: int
+    username: str
+    password: bytes
+    created_at: str
+
+
+class Character(NamedTuple):
+    id: str
+    user_id: int
+    name: str
+    race: str
+    archetype: str
+    created_at: str
+
+
+class SaveGame(NamedTuple):
+    id: str
+    character_id: str
+    current_node_id: str
+    timestamp: str
+    save_name: str
+
+
+class SaveListing(NamedTuple):
+    """save game with its character and story snippet, as listed and searched"""
+    id: str
+    character_id: str
+    current_node_id: str
+    timestamp: str
+    save_name: str
+    character_name: str
+    race: str
+    archetype: str
+    story_text_snippet: str
+    rank: Optional[float] = None  # search score, None outside of search results
+
+
+class Choice(NamedTuple):
+    id: str
+    node_id: str
+    text: str
+    next_node_id: str
+
+
+class StoryNode(NamedTuple):
+    id: str
+    text: str
+    created_at: str
+    choices: tuple = ()  # Choice records
+
+
+def columns(record, alias=None, exclude=()):
+    """SQL column list for a record, in field order"""
+    prefix = f"{alias}." if alias else ''
+    return ', '.join(prefix + field for field in record._fields if field not in exclude)
+
+
+@lru_cache(maxsize=None)
+def row_factory(record):
+    """sqlite3 row factory building records of one type"""
+    make = record._make
+    return lambda cursor, row: make(row)
@@ -0,0 +1,255 @@
+"""opt-in sampling profiler for single requests
+
+A request is profiled when it carries a valid signed X-Profile header (see
+`flask profile-token`) or is picked at random (PROFILE_SAMPLE_RATE), and its
+endpoint is in PROFILE_ROUTES (all routes when empty). While it runs, one
+sampler thread per process reads the request thread's stack from
+sys._current_frames() every PROFILE_INTERVAL seconds. Stacks are kept per
+thread ID, so concurrent requests never share samples.
+
+Each profile is written to PROFILE_DIR as two files:
+
+* <name>.collapsed - one "frame;frame;frame count" line per stack, the input
+  of flamegraph.pl, speedscope or inferno
+* <name>.txt - the call tree with sample counts and estimated milliseconds
+
+Only the newest PROFILE_KEEP profiles are kept. With PROFILE_ENABLED off no
+hook is registered, requests do not pay for the profiler at all.
+"""
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from itsdangerous import BadSignature, TimestampSigner
+
+PROFILE_HEADER = 'X-Profile'
+
+
+def frame_label(code):
+    """'function (file.py:first line)' - short enough to read in a flame graph"""
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def frame_stack(frame):
+    """labels of a thread's frames, outermost first"""
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    return tuple(labels)
+
+
+class Profile:
+    """samples of one request"""
+
+    def __init__(self, thread_id, method, path, endpoint, trigger):
+        self.thread_id = thread_id
+        self.method = method
+        self.path = path
+        self.endpoint = endpoint
+        self.trigger = trigger  # 'header' or 'sample'
+        self.status = None
+        self.stacks = Counter()
+        self.started_at = datetime.now()
+        self.started = time.perf_counter()
+        self.seconds = None
+
+    def add(self, frame):
+        self.stacks[frame_stack(frame)] += 1
+
+    def stop(self):
+        self.seconds = time.perf_counter() - self.started
+
+    @property
+    def samples(self):
+        return sum(self.stacks.values())
+
+    def collapsed_lines(self):
+        return [f"{';'.join(stack)} {count}\n" for stack, count in sorted(self.stacks.items())]
+
+    def call_tree_lines(self, interval, min_percent=0.5):
+        """indented call tree, branches below min_percent of the samples left out
+
+        Milliseconds are the share of samples times the wall time - samples come
+        further apart than the interval when the sampler waits for the GIL.
+        """
+        tree = {}  # label -> [total samples, self samples, children]
+        for stack, count in self.stacks.items():
+            children = tree
+            for depth, label in enumerate(stack):
+                node = children.setdefault(label, [0, 0, {}])
+                node[0] += count
+                if depth == len(stack) - 1:
+                    node[1] += count
+                children = node[2]
+
+        total = self.samples or 1
+        ms_per_sample = self.seconds * 1000 / total
+        lines = [
+            f"{self.method} {self.path} (endpoint {self.endpoint}, status {self.status}, trigger {self.trigger})\n",
+            f"started {self.started_at.isoformat(timespec='milliseconds')}, "
+            f"{self.seconds * 1000:.1f} ms wall time, {self.samples} samples (every {interval * 1000:g} ms requested)\n",
+            "\n",
+            f"{'total ms':>9} {'total %':>7} {'self ms':>8}  call\n",
+        ]
+
+        def walk(children, depth):
+            for label, (count, own, grandchildren) in sorted(children.items(), key=lambda item: -item[1][0]):
+                percent = count * 100 / total
+                if percent < min_percent:
+                    continue
+                lines.append(f"{count * ms_per_sample:9.1f} {percent:6.1f}% {own * ms_per_sample:8.1f}  "
+                             f"{'  ' * depth}{label}\n")
+                walk(grandchildren, depth + 1)
+
+        walk(tree, 0)
+        return lines
+
+
+class Sampler:
+    """one thread sampling the stacks of every request being profiled"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._profiles = {}  # thread ID -> Profile
+        self._thread = None
+
+    def start(self, profile):
+        with self._lock:
+            self._profiles[profile.thread_id] = profile
+            # started on demand, so forked workers run their own sampler
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+                self._thread.start()
+
+    def stop(self, profile):
+        with self._lock:
+            self._profiles.pop(profile.thread_id, None)
+        profile.stop()
+
+    def _run(self):
+        while True:
+            # sampling under the lock - once stop() returns, a profile gets no more samples
+            with self._lock:
+                if not self._profiles:
+                    # leaving while holding the lock, so start() sees the thread as finished
+                    self._thread = None
+                    return
+                frames = sys._current_frames()
+                for thread_id, profile in self._profiles.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        profile.add(frame)
+                del frames, frame
+            time.sleep(self.interval)
+
+
+class RequestProfiler:
+    """deciding which requests to profile and writing their profiles"""
+
+    def __init__(self, directory, secret_key, sample_rate=0.0, routes=(), interval=0.005, keep=100,
+                 token_max_age=3600, min_percent=0.5):
+        self.directory = directory
+        self.signer = TimestampSigner(secret_key, salt='request-profiler')
+        self.sample_rate = sample_rate
+        self.routes = frozenset(routes)
+        self.interval = interval
+        self.keep = keep
+        self.token_max_age = token_max_age
+        self.min_percent = min_percent
+        self.sampler = Sampler(interval)
+        self._write_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def create_token(self):
+        """value for the X-Profile header, valid for token_max_age seconds"""
+        return self.signer.sign('profile').decode('ascii')
+
+    def trigger_for(self, endpoint, header):
+        """'header', 'sample' or None when the request is not profiled"""
+        if endpoint is None or endpoint == 'static' or (self.routes and endpoint not in self.routes):
+            return None
+        if header:
+            try:
+                self.signer.unsign(header, max_age=self.token_max_age)
+                return 'header'
+            except BadSignature:
+                pass
+        if self.sample_rate and random.random() < self.sample_rate:
+            return 'sample'
+        return None
+
+    def start(self, method, path, endpoint, trigger):
+        profile = Profile(threading.get_ident(), method, path, endpoint, trigger)
+        self.sampler.start(profile)
+        return profile
+
+    def finish(self, profile):
+        """stopping the sampling and writing the profile files, returns their path without extension"""
+        self.sampler.stop(profile)
+        name = f"{profile.started_at:%Y%m%d-%H%M%S-%f}-{profile.endpoint}-{os.getpid()}-{profile.thread_id}"
+        base = os.path.join(self.directory, name)
+        with open(base + '.collapsed', 'w', encoding='utf-8') as f:
+            f.writelines(profile.collapsed_lines())
+        with open(base + '.txt', 'w', encoding='utf-8') as f:
+            f.writelines(profile.call_tree_lines(self.interval, self.min_percent))
+        self.prune()
+        return base
+
+    def prune(self):
+        """removing all but the newest profiles, names start with their time"""
+        with self._write_lock:
+            names = sorted(name[:-len('.txt')] for name in os.listdir(self.directory) if name.endswith('.txt'))
+            for name in names[:max(0, len(names) - self.keep)]:
+                for extension in ('.txt', '.collapsed'):
+                    try:
+                        os.remove(os.path.join(self.directory, name + extension))
+                    except FileNotFoundError:  # pruned by another worker
+                        pass
+
+
+def create_request_profiler(config, secret_key):
+    """request profiler from the app config, None when profiling is off"""
+    if not config['PROFILE_ENABLED']:
+        return None
+    return RequestProfiler(
+        config['PROFILE_DIR'],
+        secret_key,
+        sample_rate=config['PROFILE_SAMPLE_RATE'],
+        routes=[route.strip() for route in config['PROFILE_ROUTES'].split(',') if route.strip()],
+        interval=config['PROFILE_INTERVAL'],
+        keep=config['PROFILE_KEEP'],
+        token_max_age=config['PROFILE_TOKEN_MAX_AGE'],
+    )
+
+
+def register_request_profiler(app, profiler):
+    """hooks profiling the requests the profiler picks"""
+    from flask import g, request
+
+    @app.before_request
+    def start_profile():
+        trigger = profiler.trigger_for(request.endpoint, request.headers.get(PROFILE_HEADER))
+        if trigger:
+            g.profile = profiler.start(request.method, request.full_path.rstrip('?'), request.endpoint, trigger)
+
+    @app.after_request
+    def record_profile_status(response):
+        profile = g.get('profile')
+        if profile is not None:
+            profile.status = response.status_code
+        return response
+
+    @app.teardown_request
+    def finish_profile(error=None):
+        profile = g.pop('profile', None)
+        if profile is not None:
+            if error is not None and profile.status is None:
+                profile.status = 500
+            profiler.finish(profile)
@@ -0,0 +1,227 @@
+"""synthetic data generator for scale testing (`flask seed`)
+
+Bulk-generates users, characters and saves, plus an optional synthetic story
+graph, following the regular schema. Everything is derived from one random
+seed, so the same options always produce the same rows.
+
+All seeded users share the password SEED_PASSWORD, hashed once with a low
+bcrypt cost so that generating millions of users stays fast.
+"""
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+import bcrypt
+
+from story_content import ARCHETYPES, RACES
+
+SEED_PASSWORD = 'mystical'
+
+NAME_PARTS = (
+    'Ael', 'Bran', 'Cor', 'Dun', 'Eri', 'Fen', 'Gal', 'Hal', 'Isa', 'Jor',
+    'Kel', 'Lir', 'Mor', 'Nyx', 'Oru', 'Pel', 'Quo', 'Ryn', 'Syl', 'Tav',
+)
+WORDS = (
+    'moonlight', 'whispering', 'ancient', 'runes', 'altar', 'mushrooms', 'threshold', 'veil',
+    'guardian', 'shadows', 'silver', 'pendant', 'stars', 'mist', 'forgotten', 'path',
+    'clearing', 'lantern', 'realm', 'fae', 'balance', 'woods', 'spiral', 'glow',
+)
+
+BASE_TIME = datetime(2025, 1, 1)
+SPAN_DAYS = 365
+
+# day prefixes computed once, timestamps are the hot path of the generator
+DAYS = tuple((BASE_TIME + timedelta(days=day)).strftime('%Y-%m-%d ') for day in range(SPAN_DAYS))
+
+
+def _uuid(rng):
+    """UUID4 drawn from the seeded random generator"""
+    h = f"{rng.getrandbits(128):032x}"
+    # version 4 and RFC 4122 variant bits, as uuid.uuid4() sets them
+    return f"{h[:8]}-{h[8:12]}-4{h[13:16]}-{'89ab'[int(h[16], 16) & 3]}{h[17:20]}-{h[20:]}"
+
+
+def _timestamp(rng):
+    seconds = rng.randrange(SPAN_DAYS * 86400)
+    day, seconds = divmod(seconds, 86400)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    return f"{DAYS[day]}{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+
+def _name(rng):
+    return rng.choice(NAME_PARTS) + rng.choice(NAME_PARTS).lower()
+
+
+def _sentence(rng, words=40):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def _synthetic_story(rng, node_count, fan_out=3):
+    """synthetic story nodes and choices, rooted at 'synthetic-0'"""
+    node_ids = [f"synthetic-{i}" for i in range(node_count)]
+    nodes = [(node_id, _sentence(rng, 60)) for node_id in node_ids]
+    choices = []
+    for i, node_id in enumerate(node_ids):
+        # a forward edge keeps every node reachable from the root, the rest are random
+        targets = [node_ids[i + 1]] if i + 1 < node_count else []
+        while len(targets) < fan_out:
+            targets.append(rng.choice(node_ids))
+        for j, target in enumerate(targets):
+            choices.append((f"{node_id}-c{j}", node_id, _sentence(rng, 6), target))
+    return nodes, choices
+
+
+def seed_database(storage, users, characters_per_user, saves_per_character, story_nodes=0, seed=42,
+                  batch_size=10000, log=print):
+    """bulk-inserting synthetic rows into a SQLite storage, returns a summary dict
+
+    With a sharded storage, users go to the catalog and each user's characters
+    and saves to their shard. The synthetic story is added to every database.
+    """
+    # one connection per database file, a single database is catalog and shard at once
+    conns = {database: database.connect() for database in dict.fromkeys((storage.catalog, *storage.shards))}
+    try:
+        return _seed(storage, conns, users, characters_per_user, saves_per_character, story_nodes, seed,
+                     batch_size, log)
+    finally:
+        for conn in conns.values():
+            conn.close()
+
+
+def _seed(storage, conns, users, characters_per_user, saves_per_character, story_nodes, seed, batch_size, log):
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    prefix = f"seed{seed}_"
+    catalog = conns[storage.catalog]
+    shards = {database: conns[database] for database in storage.shards}
+
+    if catalog.execute("SELECT 1 FROM users WHERE username = ?", (f"{prefix}0",)).fetchone():
+        raise ValueError(f"Database already holds users seeded with seed {seed}, pick another seed.")
+
+    for database, conn in conns.items():
+        # bulk load settings - WAL stays on, fsyncs and per-row index updates go
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("PRAGMA cache_size = -262144")  # 256 MB
+        conn.execute("PRAGMA temp_store = MEMORY")
+        # secondary indexes are rebuilt once at the end instead of updated per row
+        for index in database.SECONDARY_INDEXES:
+            conn.execute(f"DROP INDEX IF EXISTS {index}")
+
+    password_hash = bcrypt.hashpw(SEED_PASSWORD.encode('utf-8'), bcrypt.gensalt(rounds=4))
+    counts = {'users': 0, 'characters': 0, 'save_games': 0, 'story_nodes': 0, 'choices': 0}
+
+    if story_nodes:
+        nodes, choices = _synthetic_story(rng, story_nodes)
+        for conn in conns.values():
+            with conn:
+                conn.executemany("INSERT OR IGNORE INTO story_nodes (id, text) VALUES (?, ?)", nodes)
+                conn.executemany(
+                    "INSERT OR IGNORE INTO choices (id, node_id, text, next_node_id) VALUES (?, ?, ?, ?)",
+                    choices
+                )
+        counts['story_nodes'], counts['choices'] = len(nodes), len(choices)
+
+    node_ids = [row[0] for row in catalog.execute("SELECT id FROM story_nodes ORDER BY id")]
+    first_user_id = (catalog.execute("SELECT MAX(id) FROM users").fetchone()[0] or 0) + 1
+
+    # the search index is filled once after the load instead of by a trigger per row
+    last_save_rowids = {}
+    for database, conn in shards.items():
+        last_save_rowids[database] = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM save_games").fetchone()[0]
+        database.drop_search_triggers(conn)
+    try:
+        _seed_players(storage, conns, rng, prefix, first_user_id, node_ids, password_hash, users,
+                      characters_per_user, saves_per_character, batch_size, counts, started, log)
+    finally:
+        log("Indexing new saves for search...")
+        for database, conn in shards.items():
+            with conn:
+                database.index_saves_for_search(conn, last_save_rowids[database])
+                database.create_search_triggers(conn)
+
+    log("Rebuilding indexes...")
+    for database, conn in conns.items():
+        database.create_indexes(conn)
+        conn.execute("ANALYZE")
+        conn.execute("PRAGMA synchronous = NORMAL")
+
+    counts['seconds'] = round(time.perf_counter() - started, 2)
+    return counts
+
+
+def _seed_players(storage, conns, rng, prefix, first_user_id, node_ids, password_hash, users, characters_per_user,
+                  saves_per_character, batch_size, counts, started, log):
+    # users are written in chunks, each chunk with its characters and saves in one transaction per database
+    users_per_chunk = max(1, batch_size // max(1, characters_per_user * max(1, saves_per_character)))
+    for chunk_start in range(0, users, users_per_chunk):
+        # database -> user, character and save rows, the catalog first so users exist before their characters
+        rows = {database: ([], [], []) for database in conns}
+        user_rows = rows[storage.catalog][0]
+        for i in range(chunk_start, min(users, chunk_start + users_per_chunk)):
+            user_id = first_user_id + i
+            user_rows.append((user_id, f"{prefix}{i}", password_hash, _timestamp(rng)))
+            _, character_rows, save_rows = rows[storage.shard_for_user(user_id)]
+            for _ in range(characters_per_user):
+                character_id = _uuid(rng)
+                name = _name(rng)
+                character_rows.append(
+                    (character_id, user_id, name, rng.choice(RACES), rng.choice(ARCHETYPES), _timestamp(rng))
+                )
+                for k in range(saves_per_character):
+                    save_rows.append(
+                        (_uuid(rng), character_id, rng.choice(node_ids), _timestamp(rng), f"{name} Save {k + 1}")
+                    )
+
+        for database, (user_rows, character_rows, save_rows) in rows.items():
+            conn = conns[database]
+            with conn:
+                conn.executemany(
+                    "INSERT INTO users (id, username, password, created_at) VALUES (?, ?, ?, ?)", user_rows
+                )
+                conn.executemany(
+                    "INSERT INTO characters (id, user_id, name, race, archetype, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    character_rows
+                )
+                conn.executemany(
+                    "INSERT INTO save_games (id, character_id, current_node_id, timestamp, save_name) VALUES (?, ?, ?, ?, ?)",
+                    save_rows
+                )
+            counts['users'] += len(user_rows)
+            counts['characters'] += len(character_rows)
+            counts['save_games'] += len(save_rows)
+
+        elapsed = time.perf_counter() - started
+        seeded = counts['users'] + counts['characters'] + counts['save_games']
+        log(f"Seeded {counts['users']}/{users} users, {seeded} rows ({seeded / elapsed:,.0f} rows/s)")
+
+
+def register_seed_command(app, storage):
+    """`flask seed` command for the SQLite storage of an app"""
+    import click
+
+    @app.cli.command('seed')
+    @click.option('--users', default=100, show_default=True, help='Number of users to generate.')
+    @click.option('--characters-per-user', default=2, show_default=True)
+    @click.option('--saves-per-character', default=5, show_default=True)
+    @click.option('--story-nodes', default=0, show_default=True, help='Size of an extra synthetic story graph.')
+    @click.option('--seed', default=42, show_default=True, help='Random seed, same seed gives the same data.')
+    @click.option('--batch-size', default=10000, show_default=True, help='Rows per transaction.')
+    def seed(users, characters_per_user, saves_per_character, story_nodes, seed, batch_size):
+        """bulk-generate synthetic players, characters and saves"""
+        if not hasattr(storage, 'database_paths'):
+            raise click.ClickException("Seeding needs the 'sqlite' or 'sharded' storage backend.")
+
+        try:
+            counts = seed_database(storage, users, characters_per_user, saves_per_character, story_nodes, seed,
+                                   batch_size)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+
+        size_mb = sum(os.path.getsize(path) for path in storage.database_paths()) / (1024 * 1024)
+        click.echo(
+            f"Done in {counts['seconds']}s: {counts['users']} users, {counts['characters']} characters, "
+            f"{counts['save_games']} saves, {counts['story_nodes']} synthetic story nodes. "
+            f"Database is {size_mb:,.1f} MB. Seeded users log in with password '{SEED_PASSWORD}'."
+        )
@@ -0,0 +1,111 @@
+"""moving players between the shards of a sharded storage (`flask rebalance-shards`)
+
+A player lives on the shard their user ID hashes to for the current shard
+count (see storage.shard_index). After SHARD_COUNT changes, players whose
+shard changed are moved: their characters and saves are copied to the new
+shard in one transaction, then deleted from the old one in another. Copies
+use INSERT OR IGNORE, so a rebalance interrupted between the two simply runs
+again. Shard files past the new shard count are emptied the same way, and
+so is the catalog itself - characters and saves still in it from a
+single-file deployment (before STORAGE_BACKEND=sharded) move to their shards.
+
+Growing from n to n + 1 shards moves about 1/(n + 1) of the players. Run it
+while the app is stopped - a player being moved sees no saves until the copy
+is committed.
+"""
+import time
+
+from models import Character, SaveGame, columns
+from storage import ShardedSQLiteStorage, SQLiteStorage, existing_shard_paths, shard_index
+
+
+def _move_players(source, target, user_ids):
+    """copying the characters and saves of users from source to target, then deleting them at source"""
+    placeholders = ', '.join('?' * len(user_ids))
+    characters = source.execute(
+        f"SELECT {columns(Character)} FROM characters WHERE user_id IN ({placeholders})", user_ids
+    ).fetchall()
+    saves = source.execute(f"""
+        SELECT {columns(SaveGame)} FROM save_games
+        WHERE character_id IN (SELECT id FROM characters WHERE user_id IN ({placeholders}))
+    """, user_ids).fetchall()
+    with target:
+        target.executemany(
+            f"INSERT OR IGNORE INTO characters ({columns(Character)}) VALUES ({', '.join('?' * len(Character._fields))})",
+            characters
+        )
+        target.executemany(
+            f"INSERT OR IGNORE INTO save_games ({columns(SaveGame)}) VALUES ({', '.join('?' * len(SaveGame._fields))})",
+            saves
+        )
+    with source:
+        source.execute(f"""
+            DELETE FROM save_games
+            WHERE character_id IN (SELECT id FROM characters WHERE user_id IN ({placeholders}))
+        """, user_ids)
+        source.execute(f"DELETE FROM characters WHERE user_id IN ({placeholders})", user_ids)
+    return len(characters), len(saves)
+
+
+def rebalance_shards(storage, batch_users=100, log=print):
+    """moving every player to the shard of their user ID, returns a summary dict"""
+    shard_count = len(storage.shards)
+    started = time.perf_counter()
+    summary = {'users': 0, 'characters': 0, 'save_games': 0, 'emptied_files': []}
+    targets = {}  # shard index -> connection
+    # the catalog first (index None), its players all belong on a shard
+    sources = [(None, storage.catalog)] + [
+        # shard files past the shard count are read through a storage of their own
+        (index, storage.shards[index] if index < shard_count else SQLiteStorage(path))
+        for index, path in sorted(existing_shard_paths(storage.database_path).items())
+    ]
+    try:
+        for index, source_storage in sources:
+            name = 'the catalog' if index is None else f"shard {index}"
+            source = source_storage.connect()
+            source.row_factory = None
+            try:
+                user_ids = [row[0] for row in source.execute("SELECT DISTINCT user_id FROM characters")]
+                moves = {}  # target index -> user IDs
+                for user_id in user_ids:
+                    target_index = shard_index(user_id, shard_count)
+                    if target_index != index:
+                        moves.setdefault(target_index, []).append(user_id)
+                for target_index, moving in sorted(moves.items()):
+                    if target_index not in targets:
+                        targets[target_index] = storage.shards[target_index].connect()
+                    for start in range(0, len(moving), batch_users):
+                        batch = moving[start:start + batch_users]
+                        characters, saves = _move_players(source, targets[target_index], batch)
+                        summary['users'] += len(batch)
+                        summary['characters'] += characters
+                        summary['save_games'] += saves
+                    log(f"Moved {len(moving)} users from {name} to shard {target_index}")
+                if index is not None and index >= shard_count:
+                    summary['emptied_files'].append(source_storage.database_path)
+            finally:
+                source.close()
+    finally:
+        for conn in targets.values():
+            conn.close()
+    summary['seconds'] = round(time.perf_counter() - started, 2)
+    return summary
+
+
+def register_shard_commands(app, storage):
+    """`flask rebalance-shards` for the sharded storage of an app"""
+    import click
+
+    @app.cli.command('rebalance-shards')
+    @click.option('--batch-users', default=100, show_default=True, help='Users moved per transaction.')
+    def rebalance(batch_users):
+        """move players to their shard after SHARD_COUNT changed or from a single-file database (with the app stopped)"""
+        if not isinstance(storage, ShardedSQLiteStorage):
+            raise click.ClickException("This command needs the 'sharded' storage backend.")
+        summary = rebalance_shards(storage, batch_users)
+        click.echo(
+            f"Moved {summary['users']} users with {summary['characters']} characters and "
+            f"{summary['save_games']} saves in {summary['seconds']}s."
+        )
+        for path in summary['emptied_files']:
+            click.echo(f"{path} is past the shard count and now empty, it can be deleted.")
@@ -0,0 +1,1102 @@
+"""storage layer for users, characters, saves and story content
+
+Routes go through one of the storage backends below instead of running SQL
+inline, so caching, batching and backend tuning live in a single place:
+
+* SQLiteStorage - tuned, file-backed storage used in production
+* ShardedSQLiteStorage - users and story in a catalog database, characters
+  and saves spread over several SQLite files to spread the write load
+* InMemoryStorage - pure Python storage for benchmarks and tests (no disk I/O)
+"""
+import glob
+import hashlib
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import traceback
+import unicodedata
+import weakref
+from datetime import datetime, timezone
+
+from models import Character, Choice, SaveGame, SaveListing, StoryNode, User, columns, row_factory
+from story_content import build_story_rows
+
+
+class StorageError(Exception):
+    """raised when a storage backend fails to write data"""
+
+
+def _timestamp():
+    """current UTC time in the same format as SQLite's CURRENT_TIMESTAMP"""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+# thread-local state abandoned by forked children, kept so it is never closed there
+_INHERITED_LOCALS = []
+
+
+def forget_connections_after_fork(instance):
+    """fresh thread-local connections for instance in forked child processes
+
+    A SQLite connection must not be used (or closed) in a child of the process
+    that opened it, so the child drops the inherited ones and opens its own.
+    """
+    ref = weakref.ref(instance)
+
+    def reset():
+        obj = ref()
+        if obj is not None:
+            _INHERITED_LOCALS.append(obj._local)
+            obj._local = threading.local()
+
+    os.register_at_fork(after_in_child=reset)
+
+
+# at most this many words of a search query are used
+MAX_SEARCH_TERMS = 8
+# search ranking weights per field of a save
+SEARCH_WEIGHTS = (('save_name', 10.0), ('character_name', 5.0), ('story_text_snippet', 1.0))
+
+
+def search_words(text):
+    """lowercase words of a text with accents stripped, like the search index tokenizer"""
+    decomposed = unicodedata.normalize('NFKD', (text or '').lower())
+    return re.findall(r'\w+', ''.join(char for char in decomposed if not unicodedata.combining(char)))
+
+
+def search_terms(query):
+    """words of a search query, each matched as a prefix"""
+    return search_words(query)[:MAX_SEARCH_TERMS]
+
+
+def rank_save_matches(saves, terms):
+    """saves where every term starts a word, best matches first
+
+    Each term scores the weight of every field it starts a word in (a save
+    name hit beats a story text hit), the same ranking SQLiteStorage does in
+    SQL. Saves with equal scores keep their incoming order.
+    """
+    matches = []
+    for save in saves:
+        fields = [(search_words(getattr(save, field)), weight) for field, weight in SEARCH_WEIGHTS]
+        score = 0.0
+        for term in terms:
+            hits = sum(weight for words, weight in fields if any(word.startswith(term) for word in words))
+            if not hits:
+                break
+            score += hits
+        else:
+            matches.append((score, save))
+    matches.sort(key=lambda match: -match[0])
+    return [save._replace(rank=score) for score, save in matches]
+
+
+class SQLiteStorage:
+    """storage backed by a single SQLite database file"""
+
+    # pragmas applied to every new connection
+    CONNECTION_PRAGMAS = (
+        "PRAGMA synchronous = NORMAL",  # safe with WAL, far fewer fsyncs
+        "PRAGMA busy_timeout = 5000",  # waiting for the write lock instead of failing
+        "PRAGMA cache_size = -8000",  # 8 MB page cache per connection
+        "PRAGMA temp_store = MEMORY",
+        "PRAGMA mmap_size = 67108864",  # 64 MB memory-mapped reads
+    )
+
+    # secondary indexes - name -> table and columns
+    SECONDARY_INDEXES = {
+        'idx_characters_user_id': 'characters (user_id)',
+        'idx_save_games_character_id': 'save_games (character_id, timestamp)',
+        'idx_choices_node_id': 'choices (node_id)',
+        'idx_fallback_segments_match': 'fallback_segments (node_id, race, archetype)',
+    }
+
+    # full-text search over saves - the index reads its content from this view,
+    # so no text is stored twice and deletes see exactly what was indexed
+    SEARCH_VIEW = '''
+    CREATE VIEW IF NOT EXISTS save_search_source AS
+    SELECT sg.rowid AS save_rowid, sg.save_name, c.name AS character_name,
+           sn.text AS story_text, 'u' || c.user_id AS owner
+    FROM save_games sg
+    JOIN characters c ON sg.character_id = c.id
+    JOIN story_nodes sn ON sg.current_node_id = sn.id
+    '''
+    # prefix indexes of the search table, older databases are rebuilt with them
+    SEARCH_PREFIX = "prefix = '1 2 3 4 5 6 7 8 9 10 11 12'"
+    SEARCH_TABLE = f'''
+    CREATE VIRTUAL TABLE IF NOT EXISTS save_search USING fts5(
+        save_name, character_name, story_text, owner,
+        content = 'save_search_source', content_rowid = 'save_rowid',
+        tokenize = 'unicode61 remove_diacritics 2', {SEARCH_PREFIX}
+    )
+    '''
+    # searched columns of the index, in the order of SEARCH_WEIGHTS
+    SEARCH_COLUMNS = ('save_name', 'character_name', 'story_text')
+    # rows of the search index for a set of saves, as 'delete' commands or inserts
+    _SEARCH_DELETE = (
+        "INSERT INTO save_search (save_search, rowid, save_name, character_name, story_text, owner) "
+        "SELECT 'delete', save_rowid, save_name, character_name, story_text, owner FROM save_search_source "
+    )
+    _SEARCH_INSERT = (
+        "INSERT INTO save_search (rowid, save_name, character_name, story_text, owner) "
+        "SELECT save_rowid, save_name, character_name, story_text, owner FROM save_search_source "
+    )
+    # triggers keeping the index in sync - name -> body
+    SEARCH_TRIGGERS = {
+        'save_search_save_insert': "AFTER INSERT ON save_games BEGIN "
+            + _SEARCH_INSERT + "WHERE save_rowid = new.rowid; END",
+        'save_search_save_delete': "BEFORE DELETE ON save_games BEGIN "
+            + _SEARCH_DELETE + "WHERE save_rowid = old.rowid; END",
+        'save_search_save_before_update': "BEFORE UPDATE ON save_games BEGIN "
+            + _SEARCH_DELETE + "WHERE save_rowid = old.rowid; END",
+        'save_search_save_after_update': "AFTER UPDATE ON save_games BEGIN "
+            + _SEARCH_INSERT + "WHERE save_rowid = new.rowid; END",
+        'save_search_character_delete': "BEFORE DELETE ON characters BEGIN "
+            + _SEARCH_DELETE + "WHERE save_rowid IN (SELECT rowid FROM save_games WHERE character_id = old.id); END",
+        'save_search_character_before_update': "BEFORE UPDATE OF name, user_id ON characters BEGIN "
+            + _SEARCH_DELETE + "WHERE save_rowid IN (SELECT rowid FROM save_games WHERE character_id = old.id); END",
+        'save_search_character_after_update': "AFTER UPDATE OF name, user_id ON characters BEGIN "
+            + _SEARCH_INSERT + "WHERE save_rowid IN (SELECT rowid FROM save_games WHERE character_id = new.id); END",
+        'save_search_node_before_update': "BEFORE UPDATE OF text ON story_nodes BEGIN "
+            + _SEARCH_DELETE + "WHERE save_rowid IN (SELECT rowid FROM save_games WHERE current_node_id = old.id); END",
+        'save_search_node_after_update': "AFTER UPDATE OF text ON story_nodes BEGIN "
+            + _SEARCH_INSERT + "WHERE save_rowid IN (SELECT rowid FROM save_games WHERE current_node_id = new.id); END",
+    }
+    # columns of a SaveListing, over save_games sg joined with characters c and story_nodes sn
+    SAVE_LISTING_COLUMNS = (
+        columns(SaveGame, 'sg')
+        + ", c.name AS character_name, c.race, c.archetype, sn.text AS story_text_snippet, NULL AS rank"
+    )
+    # the same with the rank of a search result, from a ranked subquery named search
+    SEARCH_LISTING_COLUMNS = SAVE_LISTING_COLUMNS.replace('NULL AS rank', 'search.rank')
+
+    # bumped on every change to a character's saves, so each worker process can
+    # tell whether the save list it cached is still current
+    _BUMP_SAVE_LIST = (
+        "INSERT INTO save_list_versions (character_id, version) VALUES ({}.character_id, 1) "
+        "ON CONFLICT (character_id) DO UPDATE SET version = version + 1; "
+    )
+    SAVE_LIST_TRIGGERS = {
+        'save_list_version_insert': "AFTER INSERT ON save_games BEGIN " + _BUMP_SAVE_LIST.format('new') + "END",
+        'save_list_version_delete': "AFTER DELETE ON save_games BEGIN " + _BUMP_SAVE_LIST.format('old') + "END",
+        'save_list_version_update': "AFTER UPDATE ON save_games BEGIN "
+            + _BUMP_SAVE_LIST.format('old') + _BUMP_SAVE_LIST.format('new') + "END",
+    }
+
+    def __init__(self, database_path):
+        self.database_path = database_path
+        self._local = threading.local()
+        forget_connections_after_fork(self)
+
+    # --- connection handling ---
+
+    def connect(self):
+        """new connection to the SQLite database with tuned pragmas"""
+        conn = sqlite3.connect(self.database_path)
+        conn.row_factory = sqlite3.Row
+        for pragma in self.CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def connection(self):
+        """connection reused by the current thread"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self.connect()
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        """closing the connection of the current thread"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def database_paths(self):
+        """every database file behind this storage"""
+        return [self.database_path]
+
+    # --- layout, shared with ShardedSQLiteStorage - one database is its own catalog and only shard ---
+
+    @property
+    def catalog(self):
+        """database holding users and the story"""
+        return self
+
+    @property
+    def shards(self):
+        """databases holding characters and saves"""
+        return (self,)
+
+    def shard_for_user(self, user_id):
+        """database holding a user's characters and saves"""
+        return self
+
+    def shard_for_character(self, character_id):
+        """database holding a character"""
+        return self
+
+    def check_health(self):
+        """whether the database answers a trivial query"""
+        return self._fetch_one('check_health', "SELECT 1 AS ok", ()) is not None
+
+    # --- schema ---
+
+    def init_db(self):
+        """init database tables and populate initial story"""
+        print("Initializing database...")
+        db_dir = os.path.dirname(self.database_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        conn = self.connect()
+        try:
+            # only takes effect on a new database, lets maintenance return free pages
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            # WAL lets readers carry on while a request writes
+            conn.execute("PRAGMA journal_mode = WAL")
+            c = conn.cursor()
+            self._create_tables(c)
+
+            # initial story nodes population - if not done already
+            c.execute("SELECT COUNT(*) FROM story_nodes")
+            if c.fetchone()[0] == 0:
+                print("Populating initial story nodes...")
+                self._populate_story_nodes(c)
+            else:
+                print("Story nodes already populated.")
+
+            conn.commit()
+            print("Database initialization finished successfully.")
+        except sqlite3.Error as e:
+            conn.rollback()
+            print(f"Database initialization error: {e}")
+            print(traceback.format_exc())
+            raise StorageError(f"Database initialization failed: {e}") from e
+        finally:
+            conn.close()
+
+    def _create_tables(self, c):
+        """creating the tables and indexes, if they do not exist yet"""
+        c.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL UNIQUE,
+            password TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+        c.execute('''
+        CREATE TABLE IF NOT EXISTS characters (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL, -- Foreign key linking to the users table
+            name TEXT NOT NULL,
+            race TEXT NOT NULL,
+            archetype TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        ''')
+        c.execute('''
+        CREATE TABLE IF NOT EXISTS save_games (
+            id TEXT PRIMARY KEY,
+            character_id TEXT NOT NULL,
+            current_node_id TEXT NOT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            save_name TEXT NOT NULL,
+            FOREIGN KEY (character_id) REFERENCES characters(id)
+        )
+        ''')
+        c.execute('''
+        CREATE TABLE IF NOT EXISTS story_nodes (
+            id TEXT PRIMARY KEY,
+            text TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+        c.execute('''
+        CREATE TABLE IF NOT EXISTS choices (
+            id TEXT PRIMARY KEY,
+            node_id TEXT NOT NULL,
+            text TEXT NOT NULL,
+            next_node_id TEXT NOT NULL,
+            FOREIGN KEY (node_id) REFERENCES story_nodes(id)
+        )
+        ''')
+        c.execute('''
+        CREATE TABLE IF NOT EXISTS fallback_segments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            node_id TEXT NOT NULL, -- story node the segment continues, 'dynamic' for any LLM segment
+            race TEXT NOT NULL,
+            archetype TEXT NOT NULL,
+            story_text TEXT NOT NULL,
+            choices TEXT NOT NULL, -- JSON list of choice texts
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+
+        c.execute('''
+        CREATE TABLE IF NOT EXISTS save_list_versions (
+            character_id TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        ) WITHOUT ROWID
+        ''')
+        for name, body in self.SAVE_LIST_TRIGGERS.items():
+            c.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+
+        self.create_indexes(c)
+        self._create_search_index(c)
+
+    def _create_search_index(self, c):
+        """full-text search index over saves, backfilled when it is first created"""
+        c.execute("SELECT sql FROM sqlite_master WHERE name = 'save_search'")
+        row = c.fetchone()
+        exists = row is not None
+        if exists and self.SEARCH_PREFIX not in row[0]:
+            # created with fewer prefix indexes, rebuilt once
+            print("Rebuilding the save search index with new prefix indexes...")
+            self.drop_search_triggers(c)
+            c.execute("DROP TABLE save_search")
+            exists = False
+        c.execute(self.SEARCH_VIEW)
+        c.execute(self.SEARCH_TABLE)
+        self.create_search_triggers(c)
+        if not exists:
+            print("Building the save search index...")
+            self.index_saves_for_search(c)
+
+    def create_search_triggers(self, c):
+        for name, body in self.SEARCH_TRIGGERS.items():
+            c.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+
+    def drop_search_triggers(self, c):
+        """dropping the sync triggers, for bulk loads that index afterwards"""
+        for name in self.SEARCH_TRIGGERS:
+            c.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+    def index_saves_for_search(self, c, after_rowid=0):
+        """adding saves with a rowid above after_rowid to the search index"""
+        c.execute(self._SEARCH_INSERT + "WHERE save_rowid > ?", (after_rowid,))
+
+    def create_indexes(self, c):
+        """secondary indexes for the lookups the routes do on every request"""
+        for name, definition in self.SECONDARY_INDEXES.items():
+            c.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {definition}")
+
+    def _populate_story_nodes(self, c):
+        """populating the story_nodes and choices tables with initial content"""
+        nodes, choices = build_story_rows()
+        c.executemany("INSERT OR IGNORE INTO story_nodes (id, text) VALUES (?, ?)", nodes)
+        c.executemany(
+            "INSERT INTO choices (id, node_id, text, next_node_id) VALUES (?, ?, ?, ?)",
+            choices
+        )
+
+    # --- helpers ---
+
+    def _cursor(self, record):
+        """cursor of the thread's connection, making rows into records of a type if given"""
+        cursor = self.connection().cursor()
+        if record is not None:
+            cursor.row_factory = row_factory(record)
+        return cursor
+
+    def _fetch_one(self, name, query, params, record=None):
+        """single row as a record (a dict without one), None if missing or on error"""
+        try:
+            row = self._cursor(record).execute(query, params).fetchone()
+            if row is None or record is not None:
+                return row
+            return dict(row)
+        except sqlite3.Error as e:
+            print(f"Database error in {name}: {e}")
+            print(traceback.format_exc())
+            return None
+
+    def _fetch_all(self, name, query, params, record=None):
+        """all rows as a list of records (dicts without one), empty list on error"""
+        try:
+            rows = self._cursor(record).execute(query, params).fetchall()
+            if record is not None:
+                return rows
+            return [dict(row) for row in rows]
+        except sqlite3.Error as e:
+            print(f"Database error in {name}: {e}")
+            print(traceback.format_exc())
+            return []
+
+    def _write(self, name, query, params):
+        """single write statement in its own transaction, returns the cursor"""
+        conn = self.connection()
+        try:
+            with conn:
+                return conn.execute(query, params)
+        except sqlite3.Error as e:
+            print(f"SQLite error in {name}: {e}")
+            print(traceback.format_exc())
+            raise StorageError(str(e)) from e
+
+    # --- users ---
+
+    def get_user_by_username(self, username):
+        """user fetching by their username"""
+        return self._fetch_one(
+            'get_user_by_username', f"SELECT {columns(User)} FROM users WHERE username = ?", (username,), User
+        )
+
+    def create_user(self, username, password_hash):
+        """new user creation, returns the new user ID"""
+        return self._write(
+            'create_user',
+            "INSERT INTO users (username, password) VALUES (?, ?)",
+            (username, password_hash)
+        ).lastrowid
+
+    # --- characters ---
+
+    def create_character(self, character_id, user_id, name, race, archetype):
+        """new character creation for a user"""
+        self._write(
+            'create_character',
+            "INSERT INTO characters (id, user_id, name, race, archetype) VALUES (?, ?, ?, ?, ?)",
+            (character_id, user_id, name, race, archetype)
+        )
+
+    def get_character(self, character_id):
+        """character fetching by their ID"""
+        return self._fetch_one(
+            'get_character', f"SELECT {columns(Character)} FROM characters WHERE id = ?", (character_id,), Character
+        )
+
+    # --- story ---
+
+    def get_story_node(self, node_id):
+        """story node and its associated choices fetching by node ID"""
+        node = self._fetch_one(
+            'get_story_node', f"SELECT {columns(StoryNode, exclude=('choices',))} FROM story_nodes WHERE id = ?",
+            (node_id,)
+        )
+        if not node:
+            return None
+        choices = self._fetch_all(
+            'get_story_node', f"SELECT {columns(Choice)} FROM choices WHERE node_id = ?", (node_id,), Choice
+        )
+        return StoryNode(choices=tuple(choices), **node)
+
+    def get_story_nodes(self):
+        """every story node with its choices, node ID -> node"""
+        choices_by_node = {}
+        for choice in self._fetch_all(
+            'get_story_nodes', f"SELECT {columns(Choice)} FROM choices ORDER BY rowid", (), Choice
+        ):
+            choices_by_node.setdefault(choice.node_id, []).append(choice)
+        nodes = self._fetch_all(
+            'get_story_nodes', f"SELECT {columns(StoryNode, exclude=('choices',))} FROM story_nodes", ()
+        )
+        return {
+            node['id']: StoryNode(choices=tuple(choices_by_node.get(node['id'], ())), **node)
+            for node in nodes
+        }
+
+    def get_next_node_id(self, choice_id):
+        """node ID a choice leads to, None for unknown choices"""
+        choice = self._fetch_one('get_next_node_id', "SELECT next_node_id FROM choices WHERE id = ?", (choice_id,))
+        return choice['next_node_id'] if choice else None
+
+    def get_story_structure(self):
+        """all story node IDs and (node_id, next_node_id) choice edges"""
+        node_ids = [row['id'] for row in self._fetch_all('get_story_structure', "SELECT id FROM story_nodes", ())]
+        edges = [
+            (row['node_id'], row['next_node_id'])
+            for row in self._fetch_all('get_story_structure', "SELECT node_id, next_node_id FROM choices", ())
+        ]
+        return node_ids, edges
+
+    # --- saves ---
+
+    def create_save(self, save_id, character_id, current_node_id, save_name):
+        """new save game for a character"""
+        self._write(
+            'create_save',
+            "INSERT INTO save_games (id, character_id, current_node_id, save_name) VALUES (?, ?, ?, ?)",
+            (save_id, character_id, current_node_id, save_name)
+        )
+
+    def get_save(self, save_id):
+        """save game fetching by its ID"""
+        return self._fetch_one(
+            'get_save', f"SELECT {columns(SaveGame)} FROM save_games WHERE id = ?", (save_id,), SaveGame
+        )
+
+    def get_saves_for_character(self, character_id):
+        """save games fetching for a specific character"""
+        return self._fetch_all(
+            'get_saves_for_character',
+            f"SELECT {columns(SaveGame)} FROM save_games WHERE character_id = ? ORDER BY timestamp DESC, rowid DESC",
+            (character_id,),
+            SaveGame
+        )
+
+    def get_save_list_version(self, character_id):
+        """counter bumped on every change to a character's saves, None on error"""
+        try:
+            row = self.connection().execute(
+                "SELECT version FROM save_list_versions WHERE character_id = ?", (character_id,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            # an error must never look like a current version
+            print(f"Database error in get_save_list_version: {e}")
+            return None
+        return row[0] if row is not None else 0
+
+    def get_saves_for_user(self, user_id):
+        """save games fetching for a specific user, including story snippet"""
+        return self._fetch_all('get_saves_for_user', f"""
+            SELECT {self.SAVE_LISTING_COLUMNS}
+            FROM save_games sg
+            JOIN characters c ON sg.character_id = c.id
+            JOIN story_nodes sn ON sg.current_node_id = sn.id
+            WHERE c.user_id = ?
+            ORDER BY sg.timestamp DESC, sg.rowid DESC
+        """, (user_id,), SaveListing)
+
+    def search_saves(self, user_id, query, limit=20, offset=0):
+        """user's save games matching a search query, best matches first"""
+        terms = search_terms(query)
+        if not terms:
+            return []
+        # FTS5 decides the matches - the user's owner token AND every term as a
+        # prefix of a word in the text columns. Terms up to 12 letters are served
+        # by the prefix indexes, longer ones merge the (short) doclists of the
+        # words they start. A save scores the weight of each column a term hits (see
+        # rank_save_matches), every hit set is looked up once under the owner
+        # filter. (bm25() would read the whole doclist of every term for its
+        # global statistics, across all users.) Terms are quoted, so user input
+        # never reaches the FTS5 query syntax.
+        owner = f"owner : u{int(user_id)}"
+        text_columns = '{' + ' '.join(self.SEARCH_COLUMNS) + '}'
+        match = ' AND '.join([owner] + [f'{text_columns} : "{term}"*' for term in terms])
+        hit_sets, hit_params = [], []
+        for term in terms:
+            for column, (_, weight) in zip(self.SEARCH_COLUMNS, SEARCH_WEIGHTS):
+                hit_sets.append(f"{weight} * (rowid IN (SELECT rowid FROM save_search WHERE save_search MATCH ?))")
+                hit_params.append(f'{owner} AND {column} : "{term}"*')
+        return self._fetch_all('search_saves', f"""
+            SELECT {self.SEARCH_LISTING_COLUMNS}
+            FROM (
+                SELECT rowid AS save_rowid, {' + '.join(hit_sets)} AS rank
+                FROM save_search
+                WHERE save_search MATCH ?
+                ORDER BY rank DESC, rowid DESC
+                LIMIT ? OFFSET ?
+            ) search
+            JOIN save_games sg ON sg.rowid = search.save_rowid
+            JOIN characters c ON sg.character_id = c.id
+            JOIN story_nodes sn ON sg.current_node_id = sn.id
+            ORDER BY search.rank DESC, search.save_rowid DESC
+        """, (*hit_params, match, limit, offset), SaveListing)
+
+    def delete_save_for_user(self, save_id, user_id):
+        """deleting a save game if it belongs to the user, returns True if deleted"""
+        cursor = self._write('delete_save_for_user', """
+            DELETE FROM save_games
+            WHERE id = ? AND character_id IN (SELECT id FROM characters WHERE user_id = ?)
+        """, (save_id, user_id))
+        return cursor.rowcount > 0
+
+    # --- fallback story segments ---
+
+    def add_fallback_segment(self, node_id, race, archetype, story_text, choices):
+        """pre-generated story segment and its choice texts, served when generation is late"""
+        self._write(
+            'add_fallback_segment',
+            "INSERT INTO fallback_segments (node_id, race, archetype, story_text, choices) VALUES (?, ?, ?, ?, ?)",
+            (node_id, race, archetype, story_text, json.dumps(choices))
+        )
+
+    def get_fallback_segment(self, node_id, race=None, archetype=None):
+        """random segment for a node, race and archetype (None matches any), None if there is none"""
+        conditions, params = ["node_id = ?"], [node_id]
+        for column, value in (('race', race), ('archetype', archetype)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        segment = self._fetch_one('get_fallback_segment', f"""
+            SELECT * FROM fallback_segments WHERE {' AND '.join(conditions)} ORDER BY random() LIMIT 1
+        """, params)
+        if segment:
+            segment['choices'] = json.loads(segment['choices'])
+        return segment
+
+    def count_fallback_segments(self):
+        """number of segments per (node_id, race, archetype)"""
+        rows = self._fetch_all('count_fallback_segments', """
+            SELECT node_id, race, archetype, COUNT(*) AS segments
+            FROM fallback_segments
+            GROUP BY node_id, race, archetype
+        """, ())
+        return {(row['node_id'], row['race'], row['archetype']): row['segments'] for row in rows}
+
+
+def shard_path(database_path, index):
+    """file of a shard next to the catalog - db/mystical_tale.db -> db/mystical_tale.shard-0.db"""
+    root, extension = os.path.splitext(database_path)
+    return f"{root}.shard-{index}{extension}"
+
+
+def existing_shard_paths(database_path):
+    """shard files on disk next to a catalog, index -> path, including shards past the shard count"""
+    root, extension = os.path.splitext(database_path)
+    paths = {}
+    for path in glob.glob(f"{glob.escape(root)}.shard-*{glob.escape(extension)}"):
+        match = re.fullmatch(r'\.shard-(\d+)', path[len(root):len(path) - len(extension)])
+        if match:
+            paths[int(match.group(1))] = path
+    return paths
+
+
+def jump_hash(key, buckets):
+    """bucket of a 64 bit key (Lamping and Veach's jump consistent hash)
+
+    Going from n to n + 1 buckets moves only 1/(n + 1) of the keys, all of
+    them into the new bucket, so adding a shard moves as few players as possible.
+    """
+    bucket, next_bucket = -1, 0
+    while next_bucket < buckets:
+        bucket = next_bucket
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        next_bucket = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def shard_index(user_id, shard_count):
+    """shard of a user ID, the same in every process"""
+    digest = hashlib.blake2b(str(user_id).encode('utf-8'), digest_size=8).digest()
+    return jump_hash(int.from_bytes(digest, 'big'), shard_count)
+
+
+class ShardedSQLiteStorage:
+    """users and the story in a catalog database, characters and saves on shard databases
+
+    Every SQLite file has its own write lock, so players on different shards
+    save without waiting for each other. All characters and saves of a user
+    live on the shard their user ID hashes to, and every shard holds a copy
+    of the story tables, so save listings and search stay single-database
+    queries. Characters and saves looked up by ID alone are found by asking
+    the shards in turn, the shard of a character is then remembered.
+    """
+
+    # remembered character shards, all forgotten at once past this many
+    CHARACTER_SHARDS_LIMIT = 100000
+
+    def __init__(self, database_path, shard_count=4):
+        if shard_count < 1:
+            raise ValueError(f"A sharded storage needs at least one shard, got {shard_count}.")
+        self.database_path = database_path
+        self.catalog = SQLiteStorage(database_path)
+        self.shards = tuple(SQLiteStorage(shard_path(database_path, i)) for i in range(shard_count))
+        self._character_shards = {}  # character ID -> shard index
+
+    # --- connection handling ---
+
+    def close(self):
+        """closing the connections of the current thread"""
+        for database in (self.catalog, *self.shards):
+            database.close()
+
+    def database_paths(self):
+        """every database file behind this storage, the catalog first"""
+        return [database.database_path for database in (self.catalog, *self.shards)]
+
+    def check_health(self):
+        """whether every database answers a trivial query"""
+        return all(database.check_health() for database in (self.catalog, *self.shards))
+
+    # --- schema ---
+
+    def init_db(self):
+        """init the catalog and every shard, each shard gets its own copy of the story"""
+        for database in (self.catalog, *self.shards):
+            database.init_db()
+        for shard in self.shards:
+            self._copy_story(shard)
+        stray = sorted(index for index in existing_shard_paths(self.database_path) if index >= len(self.shards))
+        if stray:
+            print(f"Warning: shard files {stray} are past the shard count ({len(self.shards)}), "
+                  f"their players are not visible until `flask rebalance-shards` moves them.")
+        conn = self.catalog.connect()
+        try:
+            characters, saves = conn.execute(
+                "SELECT (SELECT COUNT(*) FROM characters), (SELECT COUNT(*) FROM save_games)"
+            ).fetchone()
+        finally:
+            conn.close()
+        if characters or saves:
+            print(f"Warning: the catalog {self.database_path} still holds {characters} characters and {saves} saves "
+                  f"(from the single-file storage), they are not visible until `flask rebalance-shards` moves them.")
+
+    def _copy_story(self, shard):
+        """adding story nodes and choices a shard is missing (e.g. seeded before it existed) from the catalog"""
+        conn = shard.connect()
+        try:
+            conn.execute("ATTACH DATABASE ? AS catalog", (self.catalog.database_path,))
+            counts = conn.execute("""
+                SELECT (SELECT COUNT(*) FROM catalog.story_nodes) - (SELECT COUNT(*) FROM story_nodes),
+                       (SELECT COUNT(*) FROM catalog.choices) - (SELECT COUNT(*) FROM choices)
+            """).fetchone()
+            if any(counts):
+                print(f"Copying the story to {shard.database_path}...")
+                with conn:
+                    conn.execute(f"""
+                        INSERT OR IGNORE INTO story_nodes ({columns(StoryNode, exclude=('choices',))})
+                        SELECT {columns(StoryNode, exclude=('choices',))} FROM catalog.story_nodes
+                    """)
+                    conn.execute(f"""
+                        INSERT OR IGNORE INTO choices ({columns(Choice)}) SELECT {columns(Choice)} FROM catalog.choices
+                    """)
+        finally:
+            conn.close()
+
+    # --- routing ---
+
+    def shard_for_user(self, user_id):
+        """database holding a user's characters and saves"""
+        return self.shards[shard_index(user_id, len(self.shards))]
+
+    def shard_for_character(self, character_id):
+        """database holding a character, None for unknown characters"""
+        return self._locate_character(character_id)[0]
+
+    def _locate_character(self, character_id):
+        """(shard, character) of a character ID, (None, None) if no shard has it"""
+        index = self._character_shards.get(character_id)
+        if index is not None:
+            character = self.shards[index].get_character(character_id)
+            if character is not None:
+                return self.shards[index], character
+        for index, shard in enumerate(self.shards):
+            character = shard.get_character(character_id)
+            if character is not None:
+                self._remember_character(character_id, index)
+                return shard, character
+        return None, None
+
+    def _remember_character(self, character_id, index):
+        if len(self._character_shards) >= self.CHARACTER_SHARDS_LIMIT:
+            self._character_shards.clear()
+        self._character_shards[character_id] = index
+
+    # --- users ---
+
+    def get_user_by_username(self, username):
+        """user fetching by their username"""
+        return self.catalog.get_user_by_username(username)
+
+    def create_user(self, username, password_hash):
+        """new user creation, returns the new user ID"""
+        return self.catalog.create_user(username, password_hash)
+
+    # --- characters ---
+
+    def create_character(self, character_id, user_id, name, race, archetype):
+        """new character creation for a user, on the user's shard"""
+        shard = self.shard_for_user(user_id)
+        shard.create_character(character_id, user_id, name, race, archetype)
+        self._remember_character(character_id, self.shards.index(shard))
+
+    def get_character(self, character_id):
+        """character fetching by their ID"""
+        return self._locate_character(character_id)[1]
+
+    # --- story ---
+
+    def get_story_node(self, node_id):
+        """story node and its associated choices fetching by node ID"""
+        return self.catalog.get_story_node(node_id)
+
+    def get_story_nodes(self):
+        """every story node with its choices, node ID -> node"""
+        return self.catalog.get_story_nodes()
+
+    def get_next_node_id(self, choice_id):
+        """node ID a choice leads to, None for unknown choices"""
+        return self.catalog.get_next_node_id(choice_id)
+
+    def get_story_structure(self):
+        """all story node IDs and (node_id, next_node_id) choice edges"""
+        return self.catalog.get_story_structure()
+
+    # --- saves ---
+
+    def create_save(self, save_id, character_id, current_node_id, save_name):
+        """new save game for a character, on the character's shard"""
+        shard = self.shard_for_character(character_id)
+        if shard is None:
+            raise StorageError(f"Unknown character {character_id}")
+        shard.create_save(save_id, character_id, current_node_id, save_name)
+
+    def get_save(self, save_id):
+        """save game fetching by its ID"""
+        for shard in self.shards:
+            save = shard.get_save(save_id)
+            if save is not None:
+                return save
+        return None
+
+    def get_saves_for_character(self, character_id):
+        """save games fetching for a specific character"""
+        shard = self.shard_for_character(character_id)
+        return shard.get_saves_for_character(character_id) if shard is not None else []
+
+    def get_save_list_version(self, character_id):
+        """counter bumped on every change to a character's saves, None on error"""
+        shard = self.shard_for_character(character_id)
+        return shard.get_save_list_version(character_id) if shard is not None else 0
+
+    def get_saves_for_user(self, user_id):
+        """save games fetching for a specific user, including story snippet"""
+        return self.shard_for_user(user_id).get_saves_for_user(user_id)
+
+    def search_saves(self, user_id, query, limit=20, offset=0):
+        """user's save games matching a search query, best matches first"""
+        return self.shard_for_user(user_id).search_saves(user_id, query, limit, offset)
+
+    def delete_save_for_user(self, save_id, user_id):
+        """deleting a save game if it belongs to the user, returns True if deleted"""
+        return self.shard_for_user(user_id).delete_save_for_user(save_id, user_id)
+
+    # --- fallback story segments ---
+
+    def add_fallback_segment(self, node_id, race, archetype, story_text, choices):
+        """pre-generated story segment and its choice texts, served when generation is late"""
+        self.catalog.add_fallback_segment(node_id, race, archetype, story_text, choices)
+
+    def get_fallback_segment(self, node_id, race=None, archetype=None):
+        """random segment for a node, race and archetype (None matches any), None if there is none"""
+        return self.catalog.get_fallback_segment(node_id, race, archetype)
+
+    def count_fallback_segments(self):
+        """number of segments per (node_id, race, archetype)"""
+        return self.catalog.count_fallback_segments()
+
+
+class InMemoryStorage:
+    """storage kept in Python dicts, nothing touches the disk
+
+    Records are immutable, so they are stored and handed out without copies.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._users = {}  # user ID -> User
+        self._user_ids = {}  # username -> user ID
+        self._characters = {}
+        self._saves = {}
+        self._save_seq = {}  # save ID -> insertion order, orders saves with equal timestamps
+        self._save_list_versions = {}  # character ID -> changes to its saves
+        self._nodes = {}
+        self._choices = {}
+        self._fallback_segments = []
+        self._next_user_id = 1
+
+    def close(self):
+        """nothing to close, kept for parity with SQLiteStorage"""
+
+    def check_health(self):
+        """always healthy, kept for parity with SQLiteStorage"""
+        return True
+
+    def init_db(self):
+        """populating the initial story, if not done already"""
+        with self._lock:
+            if self._nodes:
+                return
+            nodes, choices = build_story_rows()
+            choices_by_node = {}
+            for row in choices:
+                choice = Choice(*row)
+                self._choices[choice.id] = choice
+                choices_by_node.setdefault(choice.node_id, []).append(choice)
+            created_at = _timestamp()
+            for node_id, text in nodes:
+                self._nodes.setdefault(
+                    node_id, StoryNode(node_id, text, created_at, tuple(choices_by_node.get(node_id, ())))
+                )
+
+    # --- users ---
+
+    def get_user_by_username(self, username):
+        """user fetching by their username"""
+        with self._lock:
+            user_id = self._user_ids.get(username)
+            return self._users[user_id] if user_id is not None else None
+
+    def create_user(self, username, password_hash):
+        """new user creation, returns the new user ID"""
+        with self._lock:
+            if username in self._user_ids:
+                raise StorageError(f"UNIQUE constraint failed: users.username ({username})")
+            user_id = self._next_user_id
+            self._next_user_id += 1
+            self._users[user_id] = User(user_id, username, password_hash, _timestamp())
+            self._user_ids[username] = user_id
+            return user_id
+
+    # --- characters ---
+
+    def create_character(self, character_id, user_id, name, race, archetype):
+        """new character creation for a user"""
+        with self._lock:
+            if character_id in self._characters:
+                raise StorageError(f"UNIQUE constraint failed: characters.id ({character_id})")
+            self._characters[character_id] = Character(character_id, user_id, name, race, archetype, _timestamp())
+
+    def get_character(self, character_id):
+        """character fetching by their ID"""
+        with self._lock:
+            return self._characters.get(character_id)
+
+    # --- story ---
+
+    def get_story_node(self, node_id):
+        """story node and its associated choices fetching by node ID"""
+        with self._lock:
+            return self._nodes.get(node_id)
+
+    def get_story_nodes(self):
+        """every story node with its choices, node ID -> node"""
+        with self._lock:
+            return dict(self._nodes)
+
+    def get_next_node_id(self, choice_id):
+        """node ID a choice leads to, None for unknown choices"""
+        with self._lock:
+            choice = self._choices.get(choice_id)
+            return choice.next_node_id if choice else None
+
+    def get_story_structure(self):
+        """all story node IDs and (node_id, next_node_id) choice edges"""
+        with self._lock:
+            edges = [(choice.node_id, choice.next_node_id) for choice in self._choices.values()]
+            return list(self._nodes), edges
+
+    # --- saves ---
+
+    def create_save(self, save_id, character_id, current_node_id, save_name):
+        """new save game for a character"""
+        with self._lock:
+            if save_id in self._saves:
+                raise StorageError(f"UNIQUE constraint failed: save_games.id ({save_id})")
+            self._saves[save_id] = SaveGame(save_id, character_id, current_node_id, _timestamp(), save_name)
+            self._save_seq[save_id] = len(self._save_seq)
+            self._bump_save_list(character_id)
+
+    def _bump_save_list(self, character_id):
+        self._save_list_versions[character_id] = self._save_list_versions.get(character_id, 0) + 1
+
+    def _newest_first(self, saves):
+        return sorted(saves, key=lambda save: (save.timestamp, self._save_seq[save.id]), reverse=True)
+
+    def get_save(self, save_id):
+        """save game fetching by its ID"""
+        with self._lock:
+            return self._saves.get(save_id)
+
+    def get_saves_for_character(self, character_id):
+        """save games fetching for a specific character"""
+        with self._lock:
+            return self._newest_first(save for save in self._saves.values() if save.character_id == character_id)
+
+    def get_save_list_version(self, character_id):
+        """counter bumped on every change to a character's saves"""
+        with self._lock:
+            return self._save_list_versions.get(character_id, 0)
+
+    def get_saves_for_user(self, user_id):
+        """save games fetching for a specific user, including story snippet"""
+        with self._lock:
+            result = []
+            for save in self._newest_first(self._saves.values()):
+                character = self._characters.get(save.character_id)
+                node = self._nodes.get(save.current_node_id)
+                # same rows as the inner joins of the SQLite query
+                if not character or not node or character.user_id != user_id:
+                    continue
+                result.append(SaveListing(*save, character.name, character.race, character.archetype, node.text))
+            return result
+
+    def search_saves(self, user_id, query, limit=20, offset=0):
+        """user's save games matching a search query, best matches first"""
+        terms = search_terms(query)
+        if not terms:
+            return []
+        return rank_save_matches(self.get_saves_for_user(user_id), terms)[offset:offset + limit]
+
+    def delete_save_for_user(self, save_id, user_id):
+        """deleting a save game if it belongs to the user, returns True if deleted"""
+        with self._lock:
+            save = self._saves.get(save_id)
+            if not save:
+                return False
+            character = self._characters.get(save.character_id)
+            if not character or character.user_id != user_id:
+                return False
+            del self._saves[save_id]
+            self._bump_save_list(save.character_id)
+            return True
+
+    # --- fallback story segments ---
+
+    def add_fallback_segment(self, node_id, race, archetype, story_text, choices):
+        """pre-generated story segment and its choice texts, served when generation is late"""
+        with self._lock:
+            self._fallback_segments.append({
+                'id': len(self._fallback_segments) + 1,
+                'node_id': node_id,
+                'race': race,
+                'archetype': archetype,
+                'story_text': story_text,
+                'choices': list(choices),
+                'created_at': _timestamp()
+            })
+
+    def get_fallback_segment(self, node_id, race=None, archetype=None):
+        """random segment for a node, race and archetype (None matches any), None if there is none"""
+        with self._lock:
+            matches = [
+                segment for segment in self._fallback_segments
+                if segment['node_id'] == node_id
+                and race in (None, segment['race'])
+                and archetype in (None, segment['archetype'])
+            ]
+            if not matches:
+                return None
+            segment = random.choice(matches)
+            return dict(segment, choices=list(segment['choices']))
+
+    def count_fallback_segments(self):
+        """number of segments per (node_id, race, archetype)"""
+        with self._lock:
+            counts = {}
+            for segment in self._fallback_segments:
+                key = (segment['node_id'], segment['race'], segment['archetype'])
+                counts[key] = counts.get(key, 0) + 1
+            return counts
+
+
+STORAGE_BACKENDS = ('sqlite', 'sharded', 'memory')
+
+
+def create_storage(backend, database_path=None, shard_count=4):
+    """storage backend instance by name - 'sqlite', 'sharded' or 'memory'"""
+    if backend == 'sqlite':
+        return SQLiteStorage(database_path)
+    if backend == 'sharded':
+        return ShardedSQLiteStorage(database_path, shard_count)
+    if backend == 'memory':
+        return InMemoryStorage()
+    raise ValueError(f"Unknown storage backend '{backend}', expected one of {', '.join(STORAGE_BACKENDS)}")
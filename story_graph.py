@@ -0,0 +1,203 @@
+"""story graph analysis, computed once when the story is loaded
+
+The graph is walked a single time at startup. Reachability, BFS depth from
+'start', dead ends, cycles and fan-out end up in small lookup tables, so the
+routes and templates can ask about any node in O(1).
+"""
+from array import array
+from collections import deque
+
+START_NODE_ID = 'start'
+
+# nodes where 'Roll the dice!' is always offered, whatever choices they have -
+# databases created before the story content was split out still carry a
+# leftover 'Continue your journey' choice on 'seek_light'
+ROLL_NODE_IDS = frozenset({'seek_light'})
+
+
+class StoryGraph:
+    """precomputed shape of the pre-defined story graph"""
+
+    UNREACHABLE = -1
+
+    def __init__(self, node_ids, edges, start_node_id=START_NODE_ID, roll_node_ids=ROLL_NODE_IDS):
+        self.start_node_id = start_node_id
+
+        # every node gets a small integer index used by the lookup tables
+        self._index = {node_id: i for i, node_id in enumerate(dict.fromkeys(node_ids))}
+        self._node_ids = tuple(self._index)
+
+        # adjacency list, choices pointing nowhere are kept aside for the report
+        adjacency = [[] for _ in self._node_ids]
+        self.dangling_choices = []  # (node_id, next_node_id)
+        self.orphan_choices = []  # choices of nodes that do not exist
+        fan_out = array('H', bytes(2 * len(self._node_ids)))
+        for node_id, next_node_id in edges:
+            source = self._index.get(node_id)
+            if source is None:
+                self.orphan_choices.append((node_id, next_node_id))
+                continue
+            fan_out[source] += 1
+            target = self._index.get(next_node_id)
+            if target is None:
+                self.dangling_choices.append((node_id, next_node_id))
+            else:
+                adjacency[source].append(target)
+        self._fan_out = fan_out
+
+        self._depth = self._bfs_depths(adjacency)
+        self.max_depth = max(self._depth, default=0)
+        self.reachable = frozenset(
+            node_id for node_id, depth in zip(self._node_ids, self._depth) if depth != self.UNREACHABLE
+        )
+        self.unreachable = frozenset(self._node_ids) - self.reachable
+        self.dead_ends = frozenset(
+            node_id for node_id, count in zip(self._node_ids, fan_out) if count == 0
+        )
+        self.cycle_nodes = frozenset(self._node_ids[i] for i in self._cyclic_indexes(adjacency))
+        # explicit roll nodes plus wherever the pre-defined story runs out
+        self.roll_nodes = (self.dead_ends | frozenset(roll_node_ids)) & self.reachable
+
+    # --- analysis passes ---
+
+    def _bfs_depths(self, adjacency):
+        """shortest number of choices from the start node, -1 if unreachable"""
+        depth = array('i', [self.UNREACHABLE] * len(self._node_ids))
+        start = self._index.get(self.start_node_id)
+        if start is None:
+            return depth
+
+        depth[start] = 0
+        queue = deque([start])
+        while queue:
+            current = queue.popleft()
+            for target in adjacency[current]:
+                if depth[target] == self.UNREACHABLE:
+                    depth[target] = depth[current] + 1
+                    queue.append(target)
+        return depth
+
+    def _cyclic_indexes(self, adjacency):
+        """indexes of nodes that sit on a cycle (iterative Tarjan SCC)"""
+        count = len(adjacency)
+        order = [0] * count  # discovery order, 0 = not visited yet
+        low = [0] * count
+        on_stack = [False] * count
+        stack = []
+        cyclic = []
+        counter = 0
+
+        for root in range(count):
+            if order[root]:
+                continue
+            work = [(root, 0)]
+            while work:
+                node, edge = work.pop()
+                if edge == 0:
+                    counter += 1
+                    order[node] = low[node] = counter
+                    stack.append(node)
+                    on_stack[node] = True
+                if edge < len(adjacency[node]):
+                    work.append((node, edge + 1))
+                    target = adjacency[node][edge]
+                    if not order[target]:
+                        work.append((target, 0))
+                    elif on_stack[target]:
+                        low[node] = min(low[node], order[target])
+                    continue
+
+                # all edges of the node done, closing its component if it is the root
+                if low[node] == order[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = False
+                        component.append(member)
+                        if member == node:
+                            break
+                    if len(component) > 1 or node in adjacency[node]:
+                        cyclic.extend(component)
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+        return cyclic
+
+    # --- O(1) lookups ---
+
+    def __contains__(self, node_id):
+        return node_id in self._index
+
+    def depth(self, node_id):
+        """number of choices from the start node, None if unknown or unreachable"""
+        i = self._index.get(node_id)
+        if i is None or self._depth[i] == self.UNREACHABLE:
+            return None
+        return self._depth[i]
+
+    def fan_out(self, node_id):
+        """number of choices offered by a node"""
+        i = self._index.get(node_id)
+        return self._fan_out[i] if i is not None else 0
+
+    def is_dead_end(self, node_id):
+        return node_id in self.dead_ends
+
+    def in_cycle(self, node_id):
+        return node_id in self.cycle_nodes
+
+    def offers_dice_roll(self, node_id):
+        """'Roll the dice!' is offered on roll nodes and where the pre-defined story runs out"""
+        return node_id in self.roll_nodes
+
+    def progress(self, node_id):
+        """(depth, max_depth) for progress display, None if unknown"""
+        depth = self.depth(node_id)
+        if depth is None:
+            return None
+        return depth, self.max_depth
+
+    # --- validation ---
+
+    def validation_report(self):
+        """problems found in the story graph, empty lists when it is sound"""
+        return {
+            'nodes': len(self._node_ids),
+            'max_depth': self.max_depth,
+            'missing_start': self.start_node_id not in self._index,
+            'dangling_choices': sorted(self.dangling_choices),
+            'orphan_choices': sorted(self.orphan_choices),
+            'unreachable_nodes': sorted(self.unreachable),
+            'dead_ends': sorted(self.dead_ends),
+            'roll_nodes': sorted(self.roll_nodes),
+            'cycle_nodes': sorted(self.cycle_nodes),
+        }
+
+    def report_lines(self):
+        """validation report as printable lines"""
+        report = self.validation_report()
+        lines = [f"Story graph: {report['nodes']} nodes, max depth {report['max_depth']}"]
+        if report['missing_start']:
+            lines.append(f"  missing start node '{self.start_node_id}'")
+        for node_id, next_node_id in report['dangling_choices']:
+            lines.append(f"  dangling choice: '{node_id}' -> '{next_node_id}' (no such node)")
+        for node_id, next_node_id in report['orphan_choices']:
+            lines.append(f"  orphan choice: '{node_id}' -> '{next_node_id}' (choice of a missing node)")
+        if report['unreachable_nodes']:
+            lines.append(f"  unreachable nodes: {', '.join(report['unreachable_nodes'])}")
+        if report['dead_ends']:
+            lines.append(f"  dead ends: {', '.join(report['dead_ends'])}")
+        else:
+            lines.append("  no dead ends - the pre-defined story never runs out")
+        if report['roll_nodes']:
+            lines.append(f"  Roll the dice! offered on: {', '.join(report['roll_nodes'])}")
+        else:
+            lines.append("  WARNING: no reachable node offers 'Roll the dice!'")
+        lines.append(f"  nodes on cycles: {len(report['cycle_nodes'])}")
+        return lines
+
+
+def build_story_graph(storage, start_node_id=START_NODE_ID):
+    """analysing the story graph held by a storage backend"""
+    node_ids, edges = storage.get_story_structure()
+    return StoryGraph(node_ids, edges, start_node_id)
@@ -0,0 +1,49 @@
+"""admission decisions, the same with both state backends"""
+import pytest
+
+from admission import BUSY, DUPLICATE, RATE_LIMITED, InProcessAdmissionState, RollAdmission, SQLiteAdmissionState
+
+
+@pytest.fixture(params=('in_process', 'sqlite'))
+def state(request, tmp_path):
+    if request.param == 'sqlite':
+        state = SQLiteAdmissionState(str(tmp_path / 'admission.db'))
+        yield state
+        state.close()
+    else:
+        yield InProcessAdmissionState()
+
+
+def test_admits_and_releases(state):
+    admission = RollAdmission(rolls_per_minute=60, burst=3, max_concurrent=2, state=state)
+    first = admission.try_admit(1, 'roll-a')
+    assert first.admitted
+    assert admission.in_flight() == 1
+    admission.release(first)
+    assert admission.in_flight() == 0
+
+
+def test_duplicate_roll_is_dropped(state):
+    admission = RollAdmission(rolls_per_minute=60, burst=3, max_concurrent=2, state=state)
+    assert admission.try_admit(1, 'roll-a').admitted
+    assert admission.try_admit(1, 'roll-a').status == DUPLICATE
+
+
+def test_global_cap(state):
+    admission = RollAdmission(rolls_per_minute=60, burst=3, max_concurrent=2, state=state)
+    assert admission.try_admit(1, 'roll-a').admitted
+    assert admission.try_admit(2, 'roll-b').admitted
+    busy = admission.try_admit(3, 'roll-c')
+    assert busy.status == BUSY and busy.retry_after > 0
+
+
+def test_rate_limit_after_burst(state):
+    admission = RollAdmission(rolls_per_minute=1, burst=2, max_concurrent=10, state=state)
+    for roll in ('roll-a', 'roll-b'):
+        admission.release(admission.try_admit(1, roll))
+    limited = admission.try_admit(1, 'roll-c')
+    assert limited.status == RATE_LIMITED
+    assert 0 < limited.retry_after <= 60
+    # a rejected roll holds no slot, and other players have their own bucket
+    assert admission.in_flight() == 0
+    assert admission.try_admit(2, 'roll-d').admitted
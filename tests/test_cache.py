@@ -0,0 +1,65 @@
+"""record caches - LRU limits, invalidation and version checks"""
+import pytest
+from flask import Flask
+
+from cache import LRUCache, RecordCache
+
+
+@pytest.fixture
+def request_context():
+    with Flask(__name__).test_request_context():
+        yield
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache('test', max_entries=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    assert cache.stats()['evictions'] == 1
+
+
+def test_lookup_loads_once_and_invalidates(request_context):
+    loads = []
+    records = RecordCache([LRUCache('records')])
+
+    def loader(key):
+        loads.append(key)
+        return [key]
+
+    assert records.lookup('records', 'k', loader) == ['k']
+    assert records.lookup('records', 'k', loader) == ['k']
+    assert loads == ['k']
+    records.invalidate('records', 'k')
+    records.lookup('records', 'k', loader)
+    assert loads == ['k', 'k']
+
+
+def test_lookup_reloads_other_versions():
+    # two worker processes, each with its own cache, one shared version counter
+    versions = {'k': 1}
+    loads = []
+    workers = [RecordCache([LRUCache('records')]) for _ in range(2)]
+
+    def lookup(records):
+        # every lookup in its own request, so the per-request memo never answers
+        with Flask(__name__).test_request_context():
+            return records.lookup('records', 'k', lambda key: loads.append(key) or versions[key],
+                                  version=versions.get)
+
+    assert [lookup(records) for records in workers] == [1, 1]
+    assert lookup(workers[1]) == 1
+    assert len(loads) == 2
+    # a write handled by the first worker bumps the version, the second reloads
+    versions['k'] = 2
+    assert lookup(workers[1]) == 2
+    assert workers[1].caches['records'].stats()['stale'] == 1
+
+
+def test_lookup_skips_the_cache_without_a_version(request_context):
+    records = RecordCache([LRUCache('records')])
+    assert records.lookup('records', 'k', lambda key: 'value', version=lambda key: None) == 'value'
+    assert records.caches['records'].stats()['entries'] == 0
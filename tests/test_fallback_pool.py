@@ -0,0 +1,37 @@
+"""fallback pool matching levels"""
+import pytest
+
+from fallback_pool import BUILTIN_SEGMENT, DYNAMIC_NODE_ID, pick_fallback_segment
+from storage import InMemoryStorage
+
+
+@pytest.fixture
+def storage():
+    storage = InMemoryStorage()
+    storage.init_db()
+    return storage
+
+
+def test_builtin_when_the_pool_is_empty(storage):
+    assert pick_fallback_segment(storage, 'seek_light', 'Elf', 'Mage') == (BUILTIN_SEGMENT, 'builtin')
+
+
+def test_levels_from_closest_to_generic(storage):
+    storage.add_fallback_segment(DYNAMIC_NODE_ID, 'Dwarf', 'Rogue', 'generic', ['Go'])
+    assert pick_fallback_segment(storage, 'seek_light', 'Elf', 'Mage')[1] == 'generic'
+
+    storage.add_fallback_segment('seek_light', 'Dwarf', 'Rogue', 'node', ['Go'])
+    segment, level = pick_fallback_segment(storage, 'seek_light', 'Elf', 'Mage')
+    assert (segment['story_text'], level) == ('node', 'node')
+
+    storage.add_fallback_segment('seek_light', 'Elf', 'Mage', 'exact', ['Go'])
+    segment, level = pick_fallback_segment(storage, 'seek_light', 'Elf', 'Mage')
+    assert (segment['story_text'], level) == ('exact', 'exact')
+
+
+def test_dynamic_rolls_match_their_own_node(storage):
+    storage.add_fallback_segment(DYNAMIC_NODE_ID, 'Dwarf', 'Rogue', 'dynamic', ['Go'])
+    segment, level = pick_fallback_segment(storage, DYNAMIC_NODE_ID, 'Elf', 'Mage')
+    assert (segment['story_text'], level) == ('dynamic', 'node')
+    # without a race and archetype only node-wide segments match
+    assert pick_fallback_segment(storage, 'seek_light')[1] == 'generic'
@@ -0,0 +1,147 @@
+"""the storage contract - every backend gives the same results"""
+import pytest
+
+from storage import StorageError, create_storage
+
+BACKENDS = ('memory', 'sqlite', 'sharded')
+
+
+@pytest.fixture(params=BACKENDS)
+def storage(request, tmp_path):
+    storage = create_storage(request.param, str(tmp_path / 'test.db'), shard_count=3)
+    storage.init_db()
+    yield storage
+    storage.close()
+
+
+@pytest.fixture
+def player(storage):
+    """(user_id, character_id) of a player with one character"""
+    user_id = storage.create_user('aria', 'hash')
+    storage.create_character('char-aria', user_id, 'Élysia', 'Elf', 'Mage')
+    return user_id, 'char-aria'
+
+
+def test_users(storage):
+    user_id = storage.create_user('aria', 'hash')
+    user = storage.get_user_by_username('aria')
+    assert (user.id, user.username, user.password) == (user_id, 'aria', 'hash')
+    assert storage.get_user_by_username('nobody') is None
+    with pytest.raises(StorageError):
+        storage.create_user('aria', 'other')
+
+
+def test_characters(storage, player):
+    user_id, character_id = player
+    character = storage.get_character(character_id)
+    assert (character.user_id, character.name, character.race, character.archetype) == (
+        user_id, 'Élysia', 'Elf', 'Mage'
+    )
+    assert storage.get_character('missing') is None
+    with pytest.raises(StorageError):
+        storage.create_character(character_id, user_id, 'Again', 'Elf', 'Mage')
+
+
+def test_story(storage):
+    start = storage.get_story_node('start')
+    assert start is not None and start.choices
+    choice = start.choices[0]
+    assert storage.get_next_node_id(choice.id) == choice.next_node_id
+    assert storage.get_next_node_id('missing') is None
+    node_ids, edges = storage.get_story_structure()
+    assert 'seek_light' in node_ids
+    assert ('remember_path', 'seek_light') in edges
+    assert set(storage.get_story_nodes()) == set(node_ids)
+
+
+def test_saves(storage, player):
+    user_id, character_id = player
+    storage.create_save('save-1', character_id, 'start', 'First')
+    storage.create_save('save-2', character_id, 'seek_light', 'Second')
+
+    assert storage.get_save('save-1').save_name == 'First'
+    assert storage.get_save('missing') is None
+    # newest first, saves within the same second keep their insertion order
+    assert [save.id for save in storage.get_saves_for_character(character_id)] == ['save-2', 'save-1']
+    listings = storage.get_saves_for_user(user_id)
+    assert [save.id for save in listings] == ['save-2', 'save-1']
+    assert listings[0].character_name == 'Élysia'
+    assert listings[0].story_text_snippet == storage.get_story_node('seek_light').text
+    assert storage.get_saves_for_character('missing') == []
+    with pytest.raises(StorageError):
+        storage.create_save('save-1', character_id, 'start', 'Again')
+
+
+def test_delete_save_only_by_owner(storage, player):
+    user_id, character_id = player
+    other_id = storage.create_user('bram', 'hash')
+    storage.create_save('save-1', character_id, 'start', 'First')
+
+    assert not storage.delete_save_for_user('save-1', other_id)
+    assert storage.delete_save_for_user('save-1', user_id)
+    assert not storage.delete_save_for_user('save-1', user_id)
+    assert storage.get_save('save-1') is None
+    assert storage.get_saves_for_user(user_id) == []
+
+
+def test_save_list_version_changes_on_writes(storage, player):
+    user_id, character_id = player
+    versions = [storage.get_save_list_version(character_id)]
+    storage.create_save('save-1', character_id, 'start', 'First')
+    versions.append(storage.get_save_list_version(character_id))
+    storage.delete_save_for_user('save-1', user_id)
+    versions.append(storage.get_save_list_version(character_id))
+    assert len(set(versions)) == 3
+
+
+def test_search(storage, player):
+    user_id, character_id = player
+    storage.create_save('save-1', character_id, 'start', 'Moonlit clearing')
+    storage.create_save('save-2', character_id, 'voice_response', 'Meeting the wyvern')
+    storage.create_save('save-3', character_id, 'remember_path', 'Lost path')
+
+    # a save name hit outranks story text hits
+    assert [save.id for save in storage.search_saves(user_id, 'wyvern')] == ['save-2']
+    assert [save.id for save in storage.search_saves(user_id, 'moon')][0] == 'save-1'
+    # every term must match, as a word prefix, accents ignored
+    assert [save.id for save in storage.search_saves(user_id, 'elysia wyv')] == ['save-2']
+    assert storage.search_saves(user_id, 'wyvern zebra') == []
+    assert storage.search_saves(user_id, 'yvern') == []
+    assert storage.search_saves(user_id, '') == []
+    # the owner filter is never matched by the query itself
+    assert storage.search_saves(user_id, f"u{user_id}") == []
+    # only the searching user's saves
+    other_id = storage.create_user('bram', 'hash')
+    assert storage.search_saves(other_id, 'wyvern') == []
+
+
+def test_search_pages(storage, player):
+    user_id, character_id = player
+    for i in range(7):
+        storage.create_save(f"save-{i}", character_id, 'start', f"Camp {i}")
+    pages = [storage.search_saves(user_id, 'camp', limit=3, offset=offset) for offset in (0, 3, 6)]
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert len({save.id for page in pages for save in page}) == 7
+    assert all(save.rank > 0 for page in pages for save in page)
+
+
+def test_search_index_follows_deletes(storage, player):
+    user_id, character_id = player
+    storage.create_save('save-1', character_id, 'start', 'Hidden grove')
+    assert storage.search_saves(user_id, 'grove')
+    storage.delete_save_for_user('save-1', user_id)
+    assert storage.search_saves(user_id, 'grove') == []
+
+
+def test_fallback_segments(storage):
+    assert storage.get_fallback_segment('seek_light') is None
+    storage.add_fallback_segment('seek_light', 'Elf', 'Mage', 'A tale', ['Left', 'Right'])
+    segment = storage.get_fallback_segment('seek_light', 'Elf', 'Mage')
+    assert (segment['story_text'], list(segment['choices'])) == ('A tale', ['Left', 'Right'])
+    assert storage.get_fallback_segment('seek_light', 'Dwarf', 'Mage') is None
+    assert storage.get_fallback_segment('seek_light') is not None
+    assert storage.count_fallback_segments() == {('seek_light', 'Elf', 'Mage'): 1}
+
+
+def test_check_health(storage):
+    assert storage.check_health()
@@ -0,0 +1,31 @@
+"""production entry point - `gunicorn -c gunicorn.conf.py wsgi:app`
+
+With preload_app (see gunicorn.conf.py) this module is imported once by the
+master process: storage, story content, story graph and compiled templates
+are built there, and forked workers share those pages copy-on-write instead
+of each building their own copy.
+"""
+import gc
+
+from app import create_app
+
+
+def warm_up(app):
+    """loading read-only data into the process, before workers are forked"""
+    # templates are compiled once and kept in the jinja environment's cache
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
+    # SQLite connections must not cross a fork, each worker opens its own
+    app.extensions['storage'].close()
+    app.extensions['roll_admission'].close()
+
+    # everything allocated so far lives as long as the process - moving it out of
+    # the collector's reach keeps gc passes in the workers from writing to (and
+    # so un-sharing) the pages it sits on
+    gc.collect()
+    gc.freeze()
+
+
+app = create_app()
+warm_up(app)